@@ -1,9 +1,17 @@
-import logging
+import sys
 import time
+import inspect
 import argparse
+from fnmatch import fnmatch
+from pathlib import Path
 
 from checkers.directory_checker import DirectoryChecker
 from utils.misc_utils import read_config_file
+from utils.config_utils import compile_config
+from utils.path_utils import parse_file_names
+
+# Arguments of DirectoryChecker given by the command line only (--resume), not by the config file
+CLI_ONLY_KEYS = {'resume_log_dir'}
 
 
 def parse_arguments():
@@ -12,24 +20,174 @@ def parse_arguments():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument('config', help='Path to the config json file', type=str)
+    parser.add_argument('--resume', metavar='LOG_DIR', default=None, type=str,
+                        help='Logging directory of an interrupted run: skip the files already checked '
+                             'and append to its logs')
+    parser.add_argument('--files', metavar='GLOB', default=None, type=str,
+                        help='Check only the files whose name matches the pattern, e.g. "multiple-states_*ssp126*"')
+    parser.add_argument('--variables', default=None, type=str,
+                        help='Check only these variables (comma-separated)')
+    parser.add_argument('--checks', default=None, type=str,
+                        help='Run only these checkers (comma-separated), e.g. valid_ranges,states_transitions')
+    parser.add_argument('--years', default=None, type=str,
+                        help='Check only the timesteps in this window, e.g. 2050-2100')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and check the files as they land in the directory')
+    parser.add_argument('--poll-interval', default=60, type=float,
+                        help='Watch mode: seconds between two scans of the directory')
+    parser.add_argument('--settle-time', default=30, type=float,
+                        help='Watch mode: seconds without change in size/mtime before a file is checked')
+    parser.add_argument('--serve', metavar='PORT', default=None, type=int,
+                        help='Run a local check service on http://127.0.0.1:PORT')
+    parser.add_argument('--queue-size', default=16, type=int,
+                        help='Service mode: maximum number of jobs accepted at the same time')
+    parser.add_argument('--workers', default=None, type=int,
+                        help='Number of worker processes (0: check in the main process; '
+                             'service mode: at least 1). The files of a scenario are checked on the same worker')
+    parser.add_argument('--validate-config', action='store_true',
+                        help='Only check the config file (keys, flags, reference paths) and exit')
+    parser.add_argument('--names-only', action='store_true',
+                        help='Only check the file names of the directory (no file is opened) and exit')
+    parser.add_argument('--shard', metavar='I/N', default=None, type=str,
+                        help='Check only the shard I (0 to N-1) of N of the files, e.g. 0/4 '
+                             '(the files of a scenario stay together). Merge the shards with the merge command')
     return parser.parse_args()
 
 
+def parse_merge_arguments(argv):
+    """
+    Parse the arguments of the merge command
+    """
+    parser = argparse.ArgumentParser(
+        prog='run_script.py merge',
+        description='Combine the results of the shard runs of a directory into one run report'
+    )
+    parser.add_argument('config', help='Path to the config json file of the shard runs', type=str)
+    parser.add_argument('--shards', metavar='N', default=None, type=int,
+                        help='Number of shards of the runs to merge (needed only if several sharded runs are found)')
+    return parser.parse_args(argv)
+
+
+def merge(argv):
+    """
+    Merge the shard runs of a directory. Return the exit code
+    """
+    args = parse_merge_arguments(argv)
+    config = validate_config(read_config_file(args.config))
+    if config is None:
+        return 1
+    config.pop('shard', None)
+
+    checker = DirectoryChecker(**config)
+    try:
+        report = checker.merge_shards(args.shards)
+    except ValueError as e:
+        print(f'Cannot merge the shards: {e}')
+        return 1
+
+    n_unchecked = sum(len(names) for names in report['unchecked_files'].values())
+    print(
+        f"{report['n_files']} file(s) of {len(report['shard_dirs'])}/{report['n_shards']} shard(s) merged "
+        f"in {checker.log_dir}, {n_unchecked} planned file(s) not checked, {report['n_errors']} error(s)"
+    )
+    return 1 if report['missing_shards'] or n_unchecked or report['n_errors'] else 0
+
+
+def validate_config(config):
+    """
+    Validate and compile the config without opening any data file.
+    Return the compiled config, or None if it is not valid
+    """
+    known_keys = set(inspect.signature(DirectoryChecker.__init__).parameters) - {'self'} - CLI_ONLY_KEYS
+    try:
+        return compile_config(config, known_keys)
+    except ValueError as e:
+        print(f'Invalid config file:\n{e}')
+        return None
+
+
+def check_names(config):
+    """
+    Check the names of the files of the directory without opening them. Return the exit code
+    """
+    files = sorted(Path(config['directory']).iterdir())
+    if config.get('select_files') is not None:
+        files = [f for f in files if fnmatch(f.name, config['select_files'])]
+
+    # Same verdict as FileNameChecker in a full run
+    infos = parse_file_names(files, config['required_file_types'])
+    invalid = []
+    for file, info in zip(files, infos):
+        if file.suffix != '.nc':
+            invalid.append(f'{info.name}: not a NetCDF file')
+        elif not file.is_file():
+            invalid.append(f'{info.name}: directory')
+        elif not info.is_valid:
+            invalid.append(f'{info.name}: {info.reason}')
+    for line in invalid:
+        print(line)
+    print(f'{len(infos) - len(invalid)} of {len(infos)} file name(s) OK')
+    return 1 if invalid else 0
+
+
 def main():
     """
     Run checker on a given directory.
     All configuration parameters must be specified in a config json file.
     """
+    # Merge the results of sharded runs
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        sys.exit(merge(sys.argv[2:]))
+
     # Parse arguments
     args = parse_arguments()
 
     # Read configuration file
     config = read_config_file(args.config)
 
+    # Selectors for targeted re-checks override the config file
+    if args.files is not None:
+        config['select_files'] = args.files
+    if args.variables is not None:
+        config['select_variables'] = args.variables.split(',')
+    if args.checks is not None:
+        config['select_checkers'] = args.checks.split(',')
+    if args.years is not None:
+        config['select_years'] = args.years
+
+    if args.workers is not None:
+        config['n_workers'] = args.workers
+    if args.shard is not None:
+        config['shard'] = args.shard
+
+    config = validate_config(config)
+    if config is None:
+        sys.exit(1)
+    if args.validate_config:
+        print('Config file OK')
+        sys.exit(0)
+    if args.names_only:
+        sys.exit(check_names(config))
+
     # Initialize and run checker
     t_start = time.perf_counter()
-    checker = DirectoryChecker(**config)
-    checker.run_checker()
+    checker = DirectoryChecker(**config, resume_log_dir=args.resume)
+    if args.serve is not None:
+        from checkers.check_service import CheckService
+        service = CheckService(
+            checker, port=args.serve,
+            n_workers=max(checker.n_workers, 1), queue_size=args.queue_size
+        )
+        service.serve()
+    elif args.watch:
+        from checkers.directory_watcher import DirectoryWatcher
+        watcher = DirectoryWatcher(
+            checker, poll_interval=args.poll_interval,
+            settle_time=args.settle_time, n_workers=checker.n_workers
+        )
+        watcher.run()
+    else:
+        checker.run_checker()
     t_end = time.perf_counter()
 
     # Report elapsed time
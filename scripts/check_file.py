@@ -1,106 +1,75 @@
+import sys
+import json
 import argparse
-from pathlib import Path
 import logging
 
-
 from checkers.directory_checker import DirectoryChecker
+from utils.misc_utils import read_config_file
+from utils.config_utils import compile_config
+from utils.stream_utils import to_builtin
 
 
 def parse_arguments():
     parser = argparse.ArgumentParser(description='File check argument parser')
-    parser.add_argument('file', type=str,
-                        help='File to which apply the checks')
-    parser.add_argument('--spatial-completeness', type=bool, default=True,
-                        help='Whether to apply spatial completeness check')
-    parser.add_argument('--spatial-consistency', type=bool, default=True,
-                        help='Whether to apply spatial consistency check')
-    parser.add_argument('--temporal-consistency', type=bool, default=True,
-                        help='Whether to apply temporal consistency check')
-    parser.add_argument('--valid-ranges', type=bool, default=True,
-                        help='Whether to apply valid_ranges check')
+    parser.add_argument('config', type=str,
+                        help='Path to the config json file')
+    parser.add_argument('files', type=str, nargs='+',
+                        help='File(s) to which apply the checks')
+    parser.add_argument('--spatial-completeness', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply spatial completeness check (default: as in the config file)')
+    parser.add_argument('--spatial-consistency', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply spatial consistency check (default: as in the config file)')
+    parser.add_argument('--temporal-consistency', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply temporal consistency check (default: as in the config file)')
+    parser.add_argument('--valid-ranges', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply valid_ranges check (default: as in the config file)')
+    parser.add_argument('--states-transitions', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply states/transitions check (default: as in the config file)')
+    parser.add_argument('--storage-layout', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply storage layout check (default: as in the config file)')
+    parser.add_argument('--reference-drift', action=argparse.BooleanOptionalAction, default=None,
+                        help='Whether to apply reference drift check (default: as in the config file)')
+    parser.add_argument('--log', action='store_true',
+                        help='Write the log files in the log_path of the config file')
+    parser.add_argument('--logging-level', type=str, default='WARNING',
+                        help='Level of the messages printed when the log files are not written')
 
     return parser.parse_args()
 
 
-def create_symlink(file, temp_dir):
-
-    if not file.exists():
-        raise FileNotFoundError(
-            f'File {file} does not exist'
-        )
-
-    # Create directory for symlink
-    temp_dir.mkdir(exist_ok=False, parents=True)
-
-    # Create symlink to file
-    symlink_path = temp_dir / file.name
-    symlink_path.symlink_to(file)
-
-
-def delete_temp_dir(pth: Path):
-    for item in pth.iterdir():
-        if item.is_dir():
-            delete_temp_dir(item)
-        else:
-            item.unlink()
-    pth.rmdir()
-
-
-def run_checker(args, temp_dir):
-
-    config = {
-        "check_directory": temp_dir,
-        "references": args.references, 
-        "metadata_file": "variable-metadata.json",
-        "flag_file_name": True,
-        "flag_standard_compliance": True,
-        "flag_spatial_completeness": args.flag_spatial_completeness,
-        "flag_spatial_consistency": args.flag_spatial_consistency,
-        "flag_temporal_consistency": args.flag_temporal_consistency,
-        "flag_valid_ranges": args.flag_valid_ranges,
-        "flag_states_transitions": args.flag_states_transitions,
-        "required_file_types": args.required_file_types,
-        "required_variables": args.required_variables,
-        "required_coords": args.required_coords,
-        "required_attributes": args.required_attributes,
-        "required_attributes_in_vars": args.required_attributes_in_vars,
-        "logging_level": "WARNING"
-    }
-
-    logging.basicConfig(level=config['logging_level'])
-
-    dschecker = DirectoryChecker(config)
-    dschecker.run_checker()
-
-
 def main():
+    """
+    Check one or several files directly (no temporary directory), e.g.:
+    python scripts/check_file.py config_lu.json file1.nc file2.nc --no-valid-ranges
+    Print the results as json; the exit code is 1 if an error was found
+    """
 
     # Read args from command line
     args = parse_arguments()
-    file = Path(args.file)
 
-    # Define root path for temporary files
-    temp_root = Path(
-        args.base_path + '/tmp' 
-        )
-    print(temp_root)
-    # Replicate file tree inside temp dir
-    temp_dir = temp_root / str(file.parents[0].absolute())[1:]
+    config = read_config_file(args.config)
+    config.pop('directory', None)
+    config = compile_config(config)
+
+    for flag in ['spatial_completeness', 'spatial_consistency', 'temporal_consistency',
+                 'valid_ranges', 'states_transitions', 'storage_layout',
+                 'reference_drift']:
+        value = getattr(args, flag)
+        if value is not None:
+            config[f'flag_{flag}'] = value
+
+    if not args.log:
+        logging.basicConfig(level=args.logging_level)
 
-    # Create symlink inside temp dir
-    create_symlink(file, temp_dir)
+    dschecker = DirectoryChecker(**config)
+    results = dschecker.check_paths(args.files, write_logs=args.log)
 
-    # Run checker
-    try:
-        run_checker(args, temp_dir)
-    except Exception:
-        print('An exception occurred during data check.')
-        print('Removing all temporary files')
-        delete_temp_dir(temp_root)
-        raise
+    print(json.dumps(results, indent=1, default=to_builtin))
 
-    # Delete temporary files
-    delete_temp_dir(temp_root)
+    n_errors = sum(dschecker.file_errors.values())
+    failed = [r for r in results.values() if r.get('worker_status', 0) != 0]
+    if n_errors or failed or len(results) < len(args.files):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
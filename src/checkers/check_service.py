@@ -0,0 +1,161 @@
+import json
+import logging
+import threading
+from pathlib import Path
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from checkers.worker_pool import CheckerPool
+from utils.isolation_utils import WORKER_EXCEPTION
+from utils.stream_utils import to_builtin
+
+
+class CheckService:
+    """
+    Local check service: accept "check these paths with these flags" jobs over HTTP on localhost
+    and run them on a bounded pool of workers which keep the reference assets in memory.
+
+    POST /check  {"paths": [...], "flags": {"flag_valid_ranges": false, ...}}
+        -> {"results": {path: {...}}, "errors": {path: message}}
+    GET /status  -> {"running_jobs": ..., "queue_size": ..., "workers": ...}
+    """
+
+    def __init__(self, dschecker, port=8765, n_workers=2, queue_size=16):
+        self.dschecker = dschecker
+        self.port = port
+        self.n_workers = n_workers
+        self.queue_size = queue_size  # Maximum number of jobs accepted at the same time
+        self.job_slots = threading.BoundedSemaphore(queue_size)
+        self.running_jobs = 0
+        self.lock = threading.Lock()
+        self.pool = None
+
+    def validate_job(self, job):
+        """
+        Return an error message if the job is not valid, None otherwise
+        """
+        if not isinstance(job, dict) or not isinstance(job.get('paths'), list):
+            return 'The job must be a json object with a list of "paths"'
+
+        for path in job['paths']:
+            if not isinstance(path, str) or not Path(path).is_file():
+                return f'File {path} not found'
+
+        flags = job.get('flags', {})
+        if not isinstance(flags, dict):
+            return '"flags" must be a json object'
+        for flag, value in flags.items():
+            if not flag.startswith('flag_') or not hasattr(self.dschecker, flag) or not isinstance(value, bool):
+                return f'Unknown flag or non-boolean value: {flag}'
+
+        return None
+
+    def run_job(self, job):
+        """
+        Check all the paths of a job in the pool and return the structured results
+        """
+        futures = [
+            (path, self.pool.submit(path, None, job.get('flags'), independent=True))
+            for path in job['paths']
+        ]
+
+        results = {}
+        errors = {}
+        fill_values = {}
+        for path, future in futures:
+            try:
+                _, results[path], fill_values[path], _ = future.result()
+            except Exception as e:
+                results[path] = {'worker_status': WORKER_EXCEPTION}
+                errors[path] = str(e)
+
+        # _FillValue consistency between the files of the job
+        seen = [v for v in fill_values.values() if v is not None]
+        if seen and any(abs(v - seen[0]) > 1.0e-5 for v in seen):
+            errors['_FillValue'] = f'Inconsistent _FillValue between the files: {fill_values}'
+
+        return {'results': results, 'errors': errors}
+
+    def make_handler(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def send_json(self, code, content):
+                body = json.dumps(content, default=to_builtin).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path != '/status':
+                    self.send_json(404, {'error': f'Unknown endpoint {self.path}'})
+                    return
+                self.send_json(200, {
+                    'running_jobs': service.running_jobs,
+                    'queue_size': service.queue_size,
+                    'workers': service.n_workers
+                })
+
+            def do_POST(self):
+                if self.path != '/check':
+                    self.send_json(404, {'error': f'Unknown endpoint {self.path}'})
+                    return
+
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                    job = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self.send_json(400, {'error': 'The job is not valid json'})
+                    return
+
+                error = service.validate_job(job)
+                if error:
+                    self.send_json(400, {'error': error})
+                    return
+
+                if not service.job_slots.acquire(blocking=False):
+                    self.send_json(503, {'error': f'Too many jobs ({service.queue_size}), retry later'})
+                    return
+
+                with service.lock:
+                    service.running_jobs += 1
+                try:
+                    self.send_json(200, service.run_job(job))
+                finally:
+                    with service.lock:
+                        service.running_jobs -= 1
+                    service.job_slots.release()
+
+            def log_message(self, format, *args):
+                logging.info(
+                    f'Service: {self.address_string()} {format % args}'
+                )
+
+        return Handler
+
+    def serve(self):
+        """
+        Serve jobs on localhost until interrupted
+        """
+        self.dschecker.start_run(rolling='service')
+
+        # Load the reference assets once, before the workers are forked
+        self.dschecker.warm_up()
+        self.pool = CheckerPool(self.dschecker, self.n_workers)
+
+        server = ThreadingHTTPServer(('127.0.0.1', self.port), self.make_handler())
+        logging.info(
+            f'Check service listening on http://127.0.0.1:{self.port} with {self.n_workers} worker(s)'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logging.info(
+                f'Check service interrupted'
+            )
+        finally:
+            server.server_close()
+            self.pool.shutdown()
+            self.dschecker.end_run()
@@ -1,7 +1,5 @@
 import logging
-import re
 
-from utils.misc_utils import get_file_re_pattern 
 
 class FileNameChecker:
     """
@@ -10,11 +8,11 @@ class FileNameChecker:
 
     def __init__(self, dschecker):
         self.dschecker = dschecker
-        self.required_file_types = dschecker.required_file_types
 
         # Read only attributes
-        self.file_type = dschecker.file_type
         self.file = dschecker.file
+        self.file_name_info = dschecker.file_name_info
+        self.in_memory = dschecker.in_memory
 
         # Check status
         self.results = {}
@@ -24,8 +22,8 @@ class FileNameChecker:
         Run file name check
         '''
         
-        # Ignore if it is a directory
-        if not self.file.is_file():
+        # Ignore if it is a directory (an in-memory dataset has only a name)
+        if not self.in_memory and not self.file.is_file():
             self.dschecker.is_valid = False
             self.results['file_name'] = 1
             logging.error(
@@ -33,36 +31,15 @@ class FileNameChecker:
             )
 
         else:
-            file_type_counter = 0
-            for filetype in self.required_file_types:
-
-                '''
-                filetype can be: "multiple-management", "multiple-states", "multiple-transitions"
-                '''
-                if filetype in self.file_type:
-                    file_type_counter += 1
-            if (not file_type_counter):
+            # Same validation as the name checks of the whole directory (run_script.py --names-only)
+            info = self.file_name_info
+            if not info.is_valid:
                 self.dschecker.is_valid = False
                 self.results['file_name'] = 2
                 logging.error(
-                    f'File type {self.file_type} is not recognized in the file {self.file.name}. Skipping all tests on this file. For emissions files please run the other checker'
+                    f'Found unexpected file: {self.file.name} ({info.reason}). Skipping all tests on this file'
                 )
-                
-            else: 
-                # if 'multiple' in self.file_type:
-                self.data_source = 'landuse' 
-                # else:
-                #     self.data_source = 'emissions'
-    
-                re_pattern = get_file_re_pattern(self.data_source)
-                pattern = re.compile(re_pattern)
-                if not pattern.match(self.file.name): 
-                    self.dschecker.is_valid = False
-                    self.results['file_name'] = 2
-                    logging.error(
-                        f'Found unexpected file: {self.file.name}. Skipping all tests on this file'
-                    )
 
-                else:
-                    self.dschecker.is_valid = True
-                    self.results['file_name'] = 0
+            else:
+                self.dschecker.is_valid = True
+                self.results['file_name'] = 0
@@ -16,13 +16,14 @@ class StandardComplianceChecker:
         self.dschecker = dschecker
 
         self.file = dschecker.file
+        self.in_memory = dschecker.in_memory
         self.data_source = dschecker.data_source 
         self.ds = dschecker.ds
         self.variable_list = dschecker.variable_list
         self.coordinate_list = dschecker.coordinate_list
+        self.variable_table = dschecker.variable_table
         self.required_attributes = dschecker.required_attributes
         self.required_attributes_in_vars = dschecker.required_attributes_in_vars
-        self.reference_file = dschecker.reference_file
         self.varname = dschecker.varname
 
         # Check results
@@ -34,6 +35,10 @@ class StandardComplianceChecker:
         """
         self.results['permissions'] = 0
 
+        if self.in_memory:
+            self.results['permissions'] = -1  # Can't be checked
+            return
+
         unix_filemode = filemode(Path(self.file).stat().st_mode)
 
         # unix_filemode[4] for group read permissions
@@ -96,11 +101,7 @@ class StandardComplianceChecker:
         
         attributes_in_vars = self.required_attributes_in_vars
         
-        vars_to_remove = ['longitude', 'lon', 'lon_bnds', 'lon_bounds', 'latitude', 'lat', 'lat_bnds', 'lat_bounds', 'crs', 'calendar', \
-                        '_FillValue', 'missing_value', 'time', 'time_bnds', 'gas', 'sector', 'sector_bnds', 'year', 'month', 'unit', 'method', \
-                        'level', 'level_bnds', 'bounds_lon', 'bounds_lat', 'bounds_time']
-        
-        vars_to_check = [v for v in self.ds.keys() if v not in vars_to_remove]
+        vars_to_check = self.variable_table.data_variables(self.ds.keys())
         
         for attr_var in attributes_in_vars:
             self.results[attr_var] = 0
@@ -1,11 +1,7 @@
-import logging, os
+import logging
 import numpy as np
-import xarray as xr
-import warnings
-warnings.filterwarnings("ignore")
 
-
-from utils.misc_utils import get_valid_data #, get_invalid_data
+from utils.cell_utils import cell_coords
 
 
 class SpatialCompletenessChecker:
@@ -21,17 +17,47 @@ class SpatialCompletenessChecker:
         self.data_source = dschecker.data_source
         self.variable = dschecker.variable
         self.variable_list = dschecker.variable_list
-        self.reference_file = dschecker.reference_file
+        self.reference = dschecker.reference
         self.filename_firstpart = dschecker.filename_firstpart
+        self.time_block = dschecker.time_block
+        self.diagnostics = dschecker.diagnostics
+        self.on_reference_grid = dschecker.on_reference_grid
+        self.uses_sparse_field = dschecker.uses_sparse_field
+        self.get_sparse_field = dschecker.get_sparse_field
+        self.get_land_mask = dschecker.get_land_mask
+        self.get_variable_scan = dschecker.get_variable_scan
 
         # Check results
         self.results = {}
 
 
+    def get_nan_locations(self, var, t):
+        """
+        NaN cells of timestep t of a variable (read again, only for the failing timesteps)
+        """
+        if self.uses_sparse_field(var):
+            field = self.get_sparse_field(var)
+            return field.nan_mask(t).reshape(field.shape)
+        return np.isnan(self.ds[var].isel(time=t).values)
+
     def run_checker(self):
         """
         Run spatial completeness check
         """
+
+        # The NaNs are compared with the masks of the reference, which are only valid on its grid
+        if self.data_source == 'landuse' and not self.reference:
+            self.results['spatial_completeness'] = -1
+            logging.error(
+                f'No reference file to take the masks from: skipping spatial completeness check'
+            )
+            return
+        if self.data_source == 'landuse' and not self.on_reference_grid:
+            self.results['spatial_completeness'] = -1
+            logging.info(
+                f'Not on the grid of the reference file: skipping spatial completeness check'
+            )
+            return
         
         for var in self.variable_list:
             
@@ -52,100 +78,44 @@ class SpatialCompletenessChecker:
                 except:
                     tt = self.ds.time # for the forcing landuse files
     
-                for i in range(len(tt)):
-                    
-                    data = data_array.isel(time=i).values
-                    
-                    if self.data_source == 'landuse':
-                       
-                        # For each var, take the reference mask (i.e. from the reference file) for the same var.
-                        # If the reference mask for this var does not exist (i.e. this var is not in the reference file),
-                        # then take the mask from another var in the reference file 
-                        # as we suppose that the reference mask is same for all vars
-                        if var in self.reference_file:
-                            mask = np.isnan(self.reference_file[var].isel(time=1).values).astype(int)
-                            if (i==0):
-                                logging.info(
-                                    f"    Mask is taken from the reference file for var={var}"
-                                )
-                            
-                            
-                            # This is for saving masks 
-                            # Delete later if not needed
-                            # ---- start
-                            '''
-                            mask_dir = f"mask_dir/{self.file.name}"
-                            if not os.path.exists(mask_dir):
-                                os.makedirs(mask_dir)
-
-                            lat_nans =  data_array.lat.values
-                            lon_nans =  data_array.lon.values                         
-                            mask_da = xr.DataArray(mask,dims=["lat","lon"],coords=[('lat', lat_nans),('lon', lon_nans)])
-                            mask_da.name = 'mask'
-                            encoding = {'mask': {'_FillValue': 1.}}       
-                            mask_da.to_netcdf(f"{mask_dir}/mask_{i}.nc",encoding=encoding)
-                            '''
-                            # ---- end
-                                
-                        else:
-                            vars_from_reference = list(self.reference_file.variables.keys())
-                            vars_to_remove = ['longitude', 'lon', 'lon_bnds', 'latitude', 'lat', 'lat_bnds', 'crs', 'calendar', \
-                                                  '_FillValue', 'missing_value', 'time', 'time_bnds', 'gas', 'sector', 'sector_bnds', 'year', 'month', 'unit', 'method', \
-                                                    'level', 'level_bnds', 'bounds_lon', 'bounds_lat', 'bounds_time']
-                            vars_from_reference = [v for v in vars_from_reference if v not in vars_to_remove]
-                            first_var = vars_from_reference[0]
-                            mask = np.isnan(self.reference_file[first_var].isel(time=0).values) 
-                            logging.info(
-                                f"No reference mask for {var}, mask is taken from the reference mask for {first_var}"
-                            )
-                            
-                        valid_data = get_valid_data(data, mask)
-
-                        # Here the mask is taken from the same file which is being checked, not from the reference file
-                        # Delete later if not needed
-                        # ---- start
-                        '''
-                        mask = np.isnan(data_array.isel(time=0).values) 
-                        print(f'Mask is taken from {var} at t=0')
-                        valid_data = get_valid_data(data, mask)
-                        '''
-                        # ---- end
-                        
+                if self.data_source == 'landuse':
+                   
+                    # For each var, take the reference mask (i.e. from the reference file) for the same var.
+                    # If the reference mask for this var does not exist (i.e. this var is not in the reference file),
+                    # then take the mask from another var in the reference file 
+                    # as we suppose that the reference mask is same for all vars.
+                    # The masks are read once per reference file (see ReferenceAssets)
+                    mask, mask_var = self.get_land_mask(var)
+                    if mask_var == var:
+                        logging.info(
+                            f"    Mask is taken from the reference file for var={var}"
+                        )
                     else:
-                        valid_data = data.flatten()
+                        logging.info(
+                            f"No reference mask for {var}, mask is taken from the reference mask for {mask_var}"
+                        )
+
+                # Only the NaNs outside the reference mask (on land) are errors.
+                # They are counted in the pass over the data shared with the other checkers (see VariableScan)
+                block_mask = mask if self.data_source == 'landuse' else None
+                scan = self.get_variable_scan(var)
+
+                for i, n_nans in enumerate(scan.land_nans):
 
                     result_timestep = 0
-                    
-                    
-                    if np.isnan(valid_data.astype(np.float)).any():
+
+                    if n_nans:
 
                         result_timestep += 1
                         timesteps_err.append(i)
-                        
-
-                        # This is for saving NaN locations 
-                        # Delete later if not needed
-                        # ---- start
-
-                        '''
-                        lat_nans =  data_array.lat.values
-                        lon_nans =  data_array.lon.values
-                        
-                        nan_locations = np.isnan(valid_data) 
-                        nan_locations_da = xr.DataArray(nan_locations,dims=["lat","lon"],
-                                                        coords=[('lat', lat_nans),('lon', lon_nans)])
-                        nan_locations_da.name = 'nan_locations'
-                        
-                        nans_dir = f"nans_data/{self.file.name}"
-                        if not os.path.exists(nans_dir):
-                            os.makedirs(nans_dir)
-                        
-                        encoding = {'nan_locations': {'_FillValue': 1.}}       
-                        nan_locations_da.to_netcdf(f"{nans_dir}/nan_locations_{i}.nc",encoding=encoding)
-                        '''
-                        
-                        # ---- end
-                            
+
+                        # Map of the unexpected NaNs (with diagnostics_dir)
+                        if self.diagnostics is not None:
+                            nan_locations = self.get_nan_locations(var, i)
+                            if block_mask is not None:
+                                nan_locations &= ~np.reshape(block_mask, nan_locations.shape)
+                            self.diagnostics.write('nan_locations', var, i, nan_locations, cell_coords(data_array))
+
                     self.results['spatial_completeness'].append(result_timestep)
                 
                 
@@ -5,7 +5,8 @@ import numpy as np
 
 class SpatialConsistencyChecker:
     """
-    Check that the lon/lat grid points correspond to the reference file
+    Check that the lon/lat grid points correspond to one of the valid grids of the file type
+    (the grid of the reference file or a grid of the config)
     """
 
     def __init__(self, dschecker):
@@ -15,11 +16,29 @@ class SpatialConsistencyChecker:
         self.ds = dschecker.ds
         self.expected_lat = dschecker.expected_lat
         self.expected_lon = dschecker.expected_lon
+        self.file_type = dschecker.file_type
+        self.grid_registry = dschecker.get_grid_registry(self.file_type)
 
         # Check results
         self.results = {}
 
     def validate_grid(self, lon: np.array, lat: np.array) -> bool:
+
+        # Known grid: matched by its fingerprint (or compared with the tolerance)
+        grid = self.grid_registry.match(self.file_type, lat, lon)
+        if grid is not None:
+            logging.info(
+                f"Grid corresponds to the grid {grid.name}"
+            )
+            return True
+
+        grids = self.grid_registry.get_grids(self.file_type)
+        if len(grids) > 1:
+            logging.error(
+                f"Grid ({len(lat)} x {len(lon)}) does not correspond to any of the expected grids: "
+                f"{[g.name for g in grids]}"
+            )
+            return False
        
         grid_equal_lon = -1
         grid_equal_lat = -1
@@ -3,8 +3,29 @@ from dateutil.relativedelta import relativedelta
 
 import numpy as np
 
-from utils.path_utils import get_dates_range
-                            
+from utils.misc_utils import get_time_years
+from utils.path_utils import get_time_category
+
+# Spacing of the timesteps in years for each time category of the files (see path_utils.get_time_category):
+# [[step, number of steps], ...] (None: until the end of the file)
+DEFAULT_TIME_SCHEDULES = {
+    'scenario': [[5, 9], [10, None]],  # 5-year steps until 2060, 10-year steps after
+    'history': [[1, None]],  # Annual histories (e.g. LUH2 850-2015)
+}
+
+
+def get_expected_steps(schedule, n_steps) -> np.ndarray:
+    """
+    Expected differences between consecutive timesteps for a spacing schedule
+    """
+    steps = []
+    for step, count in schedule:
+        remaining = n_steps - len(steps)
+        steps += [step] * (remaining if count is None else min(count, remaining))
+    # The last step is repeated if the schedule is too short
+    if len(steps) < n_steps:
+        steps += [schedule[-1][0]] * (n_steps - len(steps))
+    return np.array(steps)
 
 
 class TemporalConsistencyChecker:
@@ -16,41 +37,52 @@ class TemporalConsistencyChecker:
 
         self.file = dschecker.file
         self.directory = dschecker.directory
-        self.ds = dschecker.ds
+        # The time axis is always checked entirely (only the time coordinate is read)
+        self.ds = dschecker.ds_all_times
         self.data_source = dschecker.data_source
-        self.re_pattern = dschecker.re_pattern
         self.date_range = dschecker.date_range
+        self.start_year = dschecker.file_name_info.start_year if dschecker.file_name_info else None
+        self.end_year = dschecker.file_name_info.end_year if dschecker.file_name_info else None
+        self.time_category = dschecker.file_name_info.time_category if dschecker.file_name_info else None
+        self.time_schedules = {**DEFAULT_TIME_SCHEDULES, **(dschecker.time_schedules or {})}
 
         # Check results
         self.results = {}
 
-    def check_timestep_spacing(self, timesteps):
-      
-        # Only for landuse files
-        # if (self.data_source == 'landuse'):
-        for i, timestep in enumerate(timesteps):
-                
-            # Skip first timestep
-            if i == 0:
-                previous_time = timestep
-                continue
-
-            # Check timesteps 
-            if i<=9:
-                timediff = 5
-            else:
-                timediff = 10
-
-            if previous_time + timediff != timestep:
-                self.results['timestep_spacing'] = 2
+    def get_expected_years(self, years):
+        """
+        Expected time axis: from the start year of the file name, with the spacing schedule of the time
+        category of the file (history or scenario, from its dates range - not from the time axis)
+        """
+        start_year = self.start_year if self.start_year is not None else years[0]
+        category = self.time_category or get_time_category(start_year)
+        expected_steps = get_expected_steps(self.time_schedules[category], len(years) - 1)
+        expected = start_year + np.concatenate([[0], np.cumsum(expected_steps)])
+        return expected, expected_steps, category
+
+    def check_timestep_spacing(self, years):
+
+        expected, expected_steps, category = self.get_expected_years(years)
+
+        # Spacing between consecutive timesteps
+        steps = np.diff(years)
+        wrong = np.flatnonzero(steps != expected_steps)
+        if wrong.size:
+            self.results['timestep_spacing'] = 2
+            logging.error(
+                f"Timesteps are not consistent with the {category} schedule at {wrong.size} step(s): "
+                + ', '.join(f'{years[i]} + {expected_steps[i]} vs {years[i + 1]}' for i in wrong)
+            )
+
+        # Time axis against the dates range of the file name
+        if self.start_year is not None:
+            self.results['time_range'] = 0
+            if years[0] != expected[0] or years[-1] != self.end_year:
+                self.results['time_range'] = 2
                 logging.error(
-                    f"Timesteps are not consistent: {previous_time} + {timediff} vs {timestep}"
+                    f"Time axis {years[0]}-{years[-1]} does not correspond to the dates range "
+                    f"{self.date_range} of the file name"
                 )
-            else:
-                self.results['timestep_spacing'] = 0
-                
-                # Store previous datetime
-                previous_time = timestep
 
         # For the emission files - not needed
         '''
@@ -94,22 +126,14 @@ class TemporalConsistencyChecker:
         """
     
         if 'time' in self.ds:
-            if (self.data_source != 'landuse'):
-                datetimeindex = self.ds.indexes['time'].to_datetimeindex()
-                timesteps = datetimeindex.map(lambda x : x.replace(day=1))
-                    
-            else:
-                timesteps = self.ds.time.values
-                
+            years = get_time_years(self.ds['time'])
         else:
-            timesteps = [1]
+            years = [1]
 
 
-        if len(timesteps) == 1:  # Skip for single timestep file
+        if len(years) == 1:  # Skip for single timestep file
             self.results['timestep_spacing'] = -1
 
         else:
             self.results['timestep_spacing'] = 0
-            self.check_timestep_spacing(timesteps)
-
-      
\ No newline at end of file
+            self.check_timestep_spacing(years)
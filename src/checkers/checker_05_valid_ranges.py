@@ -1,6 +1,9 @@
 import logging
 import numpy as np
 from utils.misc_utils import get_valid_data
+from utils.histogram_utils import Histogram
+from utils.sparse_utils import sum_sparse_fields
+from utils.cell_utils import cell_coords, worst_cells, format_cells
 
 
 class ValidRangesChecker:
@@ -18,10 +21,73 @@ class ValidRangesChecker:
         self.variable_list = dschecker.variable_list 
         self.boundaries = dschecker.boundaries
         self.variable = dschecker.variable
-        self.reference_file = dschecker.reference_file
+        self.time_block = dschecker.time_block
+        self.uses_sparse_field = dschecker.uses_sparse_field
+        self.get_sparse_field = dschecker.get_sparse_field
+        self.get_variable_scan = dschecker.get_variable_scan
+        self.histogram_bins = dschecker.histogram_bins
+        self.top_k_cells = dschecker.top_k_cells
 
         self.results = {}
 
+    def get_histogram(self, min_value, max_value):
+        """
+        Histogram of the values of a variable without time dimension (None if the histograms are disabled)
+        """
+        if not self.histogram_bins:
+            return None
+        return Histogram.for_valid_range(min_value, max_value, self.histogram_bins)
+
+    def log_histogram(self, var, histogram, min_value, max_value):
+        """
+        Log the distribution of the values of a variable and store it in the results
+        """
+        self.results.setdefault('value_histograms', {})[var] = histogram.to_dict()
+        if not histogram.n_values:
+            return
+
+        q01, q50, q99 = histogram.quantiles()
+        logging.info(
+            f'   Distribution of {var}: {histogram.n_values} values, quantiles 1%/50%/99% ~ {q01:.3g}/{q50:.3g}/{q99:.3g}'
+        )
+        # One wrong cell or a whole field out of range
+        if histogram.below or histogram.above:
+            logging.warning(
+                f'Values of {var} out of the valid range [{min_value}, {max_value}] in {self.file.name}: '
+                f'{histogram.below} ({histogram.below / histogram.n_values:.2e}) below, '
+                f'{histogram.above} ({histogram.above / histogram.n_values:.2e}) above'
+            )
+
+    def get_timestep(self, var, t):
+        """
+        Values of timestep t of a variable (from memory when the file is loaded, see plan_memory)
+        """
+        if self.uses_sparse_field(var):
+            field = self.get_sparse_field(var)
+            return sum_sparse_fields([field], t)
+        return self.ds[var].isel(time=t).values
+
+    def locate_violations(self, var, data, min_value, max_value, time=None):
+        """
+        Keep the cells furthest out of the valid range (results 'range_cells')
+        """
+        if not self.top_k_cells:
+            return
+
+        data = np.asarray(data, dtype=np.float64)
+        excess = np.full(data.shape, -np.inf)
+        if max_value is not None:
+            excess = np.fmax(excess, data - max_value)
+        if min_value is not None:
+            excess = np.fmax(excess, min_value - data)
+        excess[excess <= 0] = np.nan
+
+        records = worst_cells(excess, self.top_k_cells, cell_coords(self.ds[var]), time, value=data, delta=excess)
+        self.results.setdefault('range_cells', {}).setdefault(var, []).extend(records)
+        logging.info(
+            f'   Cells of {var} furthest out of the range: {format_cells(records)}'
+        )
+
     def check_allowed_values(self, min_value, max_value, var):
        
         logging.info(
@@ -34,22 +100,26 @@ class ValidRangesChecker:
         self.results['boundaries_max'] = 0
 
         if 'time' in list(data_array.dims): 
-            
-            for tt, data_at_timestep in data_array.groupby('time'):
+
+            # Min, max and histogram of the timesteps from the pass over the data shared with
+            # the other checkers (see VariableScan)
+            scan = self.get_variable_scan(var)
+            histogram = scan.histogram
+            min_max = zip(scan.mins, scan.maxs)
+
+            times = data_array['time'].values
+            for t, (tt, (data_min, data_max)) in enumerate(zip(times, min_max)):
 
                 self.results['boundaries_min'] = 0
                 self.results['boundaries_max'] = 0
-                data = data_at_timestep.values
                
-                data_min = np.nanmin(data)
-                data_max = np.nanmax(data)
                 if min_value is not None:
 
                     # a special case when we want to see if there are negative values
                     if min_value == 0: 
                         if (data_min < min_value):
                             self.results['boundaries_min'] = -1
-                    
+                
                     else:
                         if (data_min < min_value) and (not np.isclose(data_min, min_value, atol = 0.0001, rtol = 0.0001)):
                             self.results['boundaries_min'] = -1
@@ -76,11 +146,16 @@ class ValidRangesChecker:
                     logging.info(
                         f'   Correct values of {var} at timestep {tt}'
                     )
+                else:
+                    self.locate_violations(var, self.get_timestep(var, t), min_value, max_value, tt)
+                
                     
-                        
         else:
 
             data = data_array.values
+            histogram = self.get_histogram(min_value, max_value)
+            if histogram is not None:
+                histogram.add(data)
             data_min = np.nanmin(data)
             data_max = np.nanmax(data)
 
@@ -106,6 +181,11 @@ class ValidRangesChecker:
                 logging.info(
                     f'   Correct values of {var}'
                 )
+            else:
+                self.locate_violations(var, data, min_value, max_value)
+
+        if histogram is not None:
+            self.log_histogram(var, histogram, min_value, max_value)
             
 
     def run_checker(self):
@@ -3,6 +3,18 @@ import numpy as np
 import xarray as xr
 import os.path
 
+from utils.plan_utils import get_states_file_name
+from utils.config_utils import get_transition_index
+from utils.sparse_utils import sum_sparse_fields
+from utils.kernel_utils import nan_max_abs
+from utils.cell_utils import cell_coords, worst_cells, format_cells
+
+# Precision policy: the data is float32 and is read as float32; only the conservation sums are
+# accumulated in float64. The error is then the float32 rounding of the inputs (<= 6e-8 for fractions <= 1):
+# about 1e-6 for the ~12 states of a sum (tolerance 1e-3) and for the ~24 transitions and 2 states
+# of a delta (tolerance 1e-5), so the tolerances do not depend on the number of terms or their order
+SUM_DTYPE = np.float64
+
 
 class StatesTransitionsChecker:
    
@@ -12,17 +24,41 @@ class StatesTransitionsChecker:
         self.file_type = dschecker.file_type
         self.directory = dschecker.directory
         self.ds = dschecker.ds
+        self.in_memory = dschecker.in_memory
+        self.partner_states = dschecker.partner_states
+        self.select_variables = dschecker.select_variables
+        self.select_time = dschecker.select_time
+        self.states_table = dschecker.get_variable_table('multiple-states')
+        self.uses_sparse_field = dschecker.uses_sparse_field
+        self.get_sparse_field = dschecker.get_sparse_field
+        self.top_k_cells = dschecker.top_k_cells
+        self.diagnostics = dschecker.diagnostics
 
         self.results = {}
+
+    def keep_worst_cells(self, key, var, delta, value, tolerance, coords, time):
+        """
+        Keep the cells with the largest |delta| above the tolerance at a failing timestep (results key, e.g. 'delta_cells')
+        """
+        if not self.top_k_cells:
+            return
+        delta = np.broadcast_to(delta, np.shape(value))
+        score = np.abs(delta)
+        score[~(score > tolerance)] = np.nan
+        records = worst_cells(score, self.top_k_cells, coords, time, value=value, delta=delta)
+        self.results.setdefault(key, {}).setdefault(var, []).extend(records)
+        logging.info(
+            f"        Worst cells: {format_cells(records, 'delta')}"
+        )
        
 
 
     # check No 1: only for states - sum of all vars should be equal to 1 - I checked, this is ok for all files
     # "states" is the file corresponding to the transition file self.file
-    def check_sum_of_all_vars(self, states, vars_to_remove):
+    def check_sum_of_all_vars(self, states):
     
-        vars_states = list(states.keys())
-        vars_to_check = [v for v in vars_states if v not in vars_to_remove]
+        # All the area fractions
+        vars_to_check = self.states_table.variables_with_role(states.keys(), 'state', 'natural_state')
         
         N = len(states['time'].values)
         
@@ -30,9 +66,9 @@ class StatesTransitionsChecker:
         
             summ = 0
             for key in vars_to_check:
-                summ += states[key].isel(time=t).values
+                summ = np.add(summ, states[key].isel(time=t).values, dtype=SUM_DTYPE)
         
-            absmaxsum = np.nanmax(abs(summ))
+            absmaxsum = nan_max_abs(summ)
 
             logging.info(
                 f"        sum at timestep {t}: max={absmaxsum}"
@@ -41,48 +77,56 @@ class StatesTransitionsChecker:
                 logging.warning(
                     f"        Error at timestep {t}"
                 )
-            
-
-            '''
-            if (t==1156):
-                lat =  states[key].lat.values
-                lon =  states[key].lon.values                         
-                sum_da = xr.DataArray(sum,dims=["lat","lon"],coords=[('lat', lat),('lon', lon)])
-                sum_da.name  = 'sum'
-                sum_da.to_netcdf(f"{outdir}/sum_{t}.nc")
-            '''
+                coords = cell_coords(states[vars_to_check[0]])
+                self.keep_worst_cells('sum_cells', 'sum', summ - 1, summ, 1e-3, coords, states['time'].values[t])
+                if self.diagnostics is not None:
+                    self.diagnostics.write('delta', 'sum', t, summ - 1, coords)
 
 
 
     # check No 2: the sum of the gross landuse transitions should be equal to the difference in states between two consecutive years 
     # this is ok for the reference files but delta is not close to 0 for the forcings files
 
-    def check_states_vs_transitions(self, trans, states, vars_to_remove):
+    def sum_transitions(self, trans, keys, t):
+        """
+        Sum of the transitions at timestep t (from their nonzero cells for the sparse transitions)
+        """
+        sparse_keys = [key for key in keys if self.uses_sparse_field(key)]
+        dense_keys = [key for key in keys if key not in sparse_keys]
+
+        total = sum_sparse_fields([self.get_sparse_field(key) for key in sparse_keys], t, dtype=SUM_DTYPE)
+        for key in dense_keys:
+            total = np.add(total, trans[key].isel(time=t).values, dtype=SUM_DTYPE)
+        return total
+
+    def check_states_vs_transitions(self, trans, states):
 
         N = len(states['time'].values)
 
-        vars_trans = list(trans.keys())
-        vars_states = list(states.keys())
+        # The natural vegetation states are not checked
+        vars_to_check = self.states_table.variables_with_role(states.keys(), 'state')
+        transition_index = get_transition_index(trans.keys())
 
-        vars_to_check = [v for v in vars_states if v not in vars_to_remove]
+        # With a selection of variables, check the states involved in the selected states or transitions
+        if self.select_variables is not None:
+            vars_to_check = [
+                v for v in vars_to_check
+                if any(s == v or s.startswith(v + "_to_") or s.endswith("_to_" + v) for s in self.select_variables)
+            ]
 
         for var in vars_to_check:
         
 
-            X_to_var = "_to_"+var 
-            var_to_X = var+"_to_" 
-                
             logging.info(
                 f"    Checking states vs transitions: delta = sum_{var}_transitions - states | Y - (Y+1))"
             )
             
-            trans_X_to_var = [v for v in vars_trans if X_to_var in v] 
-            trans_var_to_X = [v for v in vars_trans if var_to_X in v]
+            trans_var_to_X, trans_X_to_var = transition_index.get(var, ([], []))
             
             for t in range(N - 1):
             
-                sum_X_to_var = sum(trans[key].isel(time=t).values for key in trans_X_to_var)
-                sum_var_to_X = sum(trans[key].isel(time=t).values for key in trans_var_to_X)
+                sum_X_to_var = self.sum_transitions(trans, trans_X_to_var, t)
+                sum_var_to_X = self.sum_transitions(trans, trans_var_to_X, t)
                 
                 thisyear = states[var].isel(time=t).values
                 
@@ -93,24 +137,22 @@ class StatesTransitionsChecker:
                 anotheryear = states[var].isel(time=yeartocheck).values
 
                 result1 = sum_var_to_X - sum_X_to_var
-                result2 = thisyear - anotheryear
-                delta = result1 - result2
+                result2 = np.subtract(thisyear, anotheryear, dtype=SUM_DTYPE)
+                # max(|result1 - result2|) in one pass, without the delta array
+                maxdelta = nan_max_abs(result1, result2)
                 
-                '''
-                lat, lon = states[var].lat.values, states[var].lon.values
 
-                delta_da = xr.DataArray(delta, dims=["lat", "lon"], coords=[('lat', lat), ('lon', lon)])
-                delta_da.name = f'{var}_to_X-X_to_{var} - states_this_yr-next_yr'
-                delta_da.to_netcdf(f"{outdir}/delta_{var}_{t}.nc")
-                '''
-
-                if np.nanmax(abs(delta)) > 1e-5:
+                if maxdelta > 1e-5:
                     logging.warning(
-                        f"        Warning: maxdelta for var {var} at timestep {t}: {np.nanmax(abs(delta))}"
+                        f"        Warning: maxdelta for var {var} at timestep {t}: {maxdelta}"
                     )
+                    coords = cell_coords(states[var])
+                    self.keep_worst_cells('delta_cells', var, result1 - result2, thisyear, 1e-5, coords, states['time'].values[t])
+                    if self.diagnostics is not None:
+                        self.diagnostics.write('delta', var, t, np.broadcast_to(result1 - result2, thisyear.shape), coords)
                 else:
                     logging.info(
-                        f"        Correct: maxdelta for var {var} at timestep {t}: {np.nanmax(abs(delta))}"
+                        f"        Correct: maxdelta for var {var} at timestep {t}: {maxdelta}"
                     )
 
 
@@ -123,14 +165,6 @@ class StatesTransitionsChecker:
         """
        
 
-        vars_to_remove_1 = ['longitude', 'lon', 'lon_bnds', 'lon_bounds', 
-                        'latitude', 'lat', 'lat_bnds', 'lat_bounds', 'crs', 'calendar', 
-                        '_FillValue', 'missing_value', 'time', 'time_bnds', 'time_bounds', 
-                        'gas', 'sector', 'sector_bnds', 'sector_bounds', 'year', 'month', 
-                        'unit', 'method', 'level', 'level_bnds', 'bounds_lon', 'bounds_lat', 'bounds_time', 
-                        'secma', 'secmb']
-        vars_to_remove_2 = vars_to_remove_1 + ['secdf', 'primf', 'secdn', 'primn']
-
 
         if self.file_type == "multiple-transitions":
             file_transitions = self.file.name
@@ -139,10 +173,14 @@ class StatesTransitionsChecker:
                 f"should be equal to the difference in states between two consecutive years"
             )
 
-            tail = file_transitions[20:]
-            file_states = "multiple-states" + tail   
+            file_states = get_states_file_name(file_transitions)
              
-            if not os.path.isfile(str(self.directory) + "/" + file_states):
+            if self.partner_states is not None:
+                # In-memory transitions dataset checked with the states dataset given by the caller
+                self.check_states_vs_transitions(self.ds, self.select_time(self.partner_states))
+
+            # The states file is expected next to the transitions file
+            elif self.in_memory or not os.path.isfile(str(self.file.parent) + "/" + file_states):
                 logging.error(
                     f'    No file corresponding to {file_transitions}! Skipping the check'
                 )
@@ -150,8 +188,8 @@ class StatesTransitionsChecker:
             else:
 
                 trans = self.ds #xr.open_dataset(os.path.join(indir, file_transitions), decode_times=False)
-                states = xr.open_dataset(os.path.join(self.directory, file_states), decode_times=False)
-                self.check_states_vs_transitions(trans, states, vars_to_remove_2)
+                with xr.open_dataset(os.path.join(self.file.parent, file_states), decode_times=False) as states:
+                    self.check_states_vs_transitions(trans, self.select_time(states))
 
 
         else:
@@ -162,7 +200,7 @@ class StatesTransitionsChecker:
                 )
                 states = self.ds # xr.open_dataset(os.path.join(indir, file_states), decode_times=False)
                
-                self.check_sum_of_all_vars(states, vars_to_remove_1)
+                self.check_sum_of_all_vars(states)
 
             else:
                 logging.info(
@@ -0,0 +1,174 @@
+import logging
+import math
+
+import numpy as np
+
+# Smallest read of contiguous data in bytes (the default sieve buffer of HDF5)
+CONTIGUOUS_READ_UNIT = 64 * 1024
+
+# Thresholds of the layout check (can be overridden with "storage_layout" in the config file)
+DEFAULT_STORAGE_LAYOUT = {
+    # Bytes read / bytes needed to read one timestep of a variable (all cells)
+    'max_timestep_amplification': 10,
+    # Bytes read / bytes needed to read the time series of one cell: above, most of the map is read for each
+    # timestep (e.g. 1e6 for chunks of one timestep of a 0.25 degree grid)
+    'max_timeseries_amplification': 1.0e5,
+    # Higher deflate levels make the files much slower to read for a small gain in size
+    'max_complevel': 6,
+    # Deflate without the shuffle filter compresses floating point data poorly
+    'require_shuffle': True,
+    # Allowed data types (null: any)
+    'allowed_dtypes': None,
+}
+
+
+def get_read_amplification(shape, chunks, time_axis):
+    """
+    Bytes read / bytes needed (decompressed) for reading one timestep and
+    the time series of one cell, when whole chunks have to be read
+    """
+    # Chunks covering one timestep: all the chunks of the other dimensions, for one time chunk
+    timestep = chunks[time_axis]
+    for axis, (size, chunk) in enumerate(zip(shape, chunks)):
+        if axis != time_axis:
+            timestep *= math.ceil(size / chunk) * chunk / size
+
+    # Chunks covering the time series of one cell: one chunk for each time chunk
+    timeseries = math.ceil(shape[time_axis] / chunks[time_axis]) * chunks[time_axis] / shape[time_axis]
+    for axis, chunk in enumerate(chunks):
+        if axis != time_axis:
+            timeseries *= chunk
+
+    return timestep, timeseries
+
+
+def get_contiguous_amplification(shape, itemsize, time_axis, read_unit=CONTIGUOUS_READ_UNIT):
+    """
+    Same as get_read_amplification for contiguous (row-major) storage: each run of contiguous values
+    which is needed costs at least read_unit bytes, or the gap to the next run if it is shorter
+    """
+    def amplification(run, stride, n_runs):
+        # n_runs runs of run bytes, one every stride bytes
+        if n_runs <= 1 or run >= stride:
+            return 1.0
+        return min(stride, max(run, read_unit)) / run
+
+    inner = math.prod(shape[time_axis + 1:]) * itemsize  # Bytes between consecutive timesteps of a cell
+
+    # One timestep: a run of the inner bytes for each index of the dimensions before time
+    timestep = amplification(inner, shape[time_axis] * inner, math.prod(shape[:time_axis]))
+
+    # Time series of one cell: one value every inner bytes
+    timeseries = amplification(itemsize, inner, shape[time_axis])
+
+    return timestep, timeseries
+
+
+class StorageLayoutChecker:
+    """
+    Check the storage layout of the variables (chunking, compression, data type)
+    for the access patterns of the models: per timestep and per cell time series
+    """
+
+    def __init__(self, dschecker):
+
+        self.file = dschecker.file
+        # The layout is the one of the whole file
+        self.ds = dschecker.ds_all_times
+        self.variable_list = dschecker.variable_list
+        self.thresholds = {**DEFAULT_STORAGE_LAYOUT, **(dschecker.storage_layout or {})}
+
+        self.results = {}
+
+    def get_layout(self, var):
+        """
+        Layout of a variable read from its encoding, None if it is not known (e.g. in-memory dataset)
+        """
+        encoding = self.ds[var].encoding
+        if 'dtype' not in encoding and 'chunksizes' not in encoding and 'contiguous' not in encoding:
+            return None
+
+        chunks = encoding.get('chunksizes')
+        contiguous = encoding.get('contiguous', chunks is None)
+        return {
+            'chunks': None if contiguous else tuple(chunks),
+            'zlib': bool(encoding.get('zlib', False)),
+            'complevel': encoding.get('complevel', 0) if encoding.get('zlib', False) else 0,
+            'shuffle': bool(encoding.get('shuffle', False)),
+            'dtype': str(np.dtype(encoding.get('dtype', self.ds[var].dtype))),
+        }
+
+    def check_layout(self, var, layout):
+        """
+        Return the problems of the layout of a variable
+        """
+        problems = []
+        data_array = self.ds[var]
+
+        if self.thresholds['allowed_dtypes'] is not None and layout['dtype'] not in self.thresholds['allowed_dtypes']:
+            problems.append(f"data type {layout['dtype']} (allowed: {self.thresholds['allowed_dtypes']})")
+
+        if layout['complevel'] > self.thresholds['max_complevel']:
+            problems.append(f"deflate level {layout['complevel']} > {self.thresholds['max_complevel']}")
+
+        if self.thresholds['require_shuffle'] and layout['zlib'] and not layout['shuffle']:
+            problems.append('deflate without the shuffle filter')
+
+        if 'time' not in data_array.dims:
+            return problems
+
+        time_axis = data_array.dims.index('time')
+        if layout['chunks'] is None:
+            storage = 'contiguous'
+            timestep, timeseries = get_contiguous_amplification(
+                data_array.shape, np.dtype(layout['dtype']).itemsize, time_axis
+            )
+        else:
+            storage = f"chunks {layout['chunks']}"
+            timestep, timeseries = get_read_amplification(data_array.shape, layout['chunks'], time_axis)
+        logging.info(
+            f"    {var}: {storage}, read amplification {timestep:.3g} per timestep, "
+            f"{timeseries:.3g} per cell time series"
+        )
+
+        max_timestep = self.thresholds['max_timestep_amplification']
+        if max_timestep is not None and timestep > max_timestep:
+            problems.append(f"{storage}: read amplification {timestep:.3g} per timestep > {max_timestep}")
+
+        max_timeseries = self.thresholds['max_timeseries_amplification']
+        if max_timeseries is not None and timeseries > max_timeseries:
+            problems.append(
+                f"{storage}: read amplification {timeseries:.3g} per cell time series > {max_timeseries}"
+            )
+
+        return problems
+
+    def run_checker(self):
+        """
+        Run storage layout check
+        """
+        # The variables usually share the same layout: each layout is checked once
+        checked = {}
+        for var in self.variable_list:
+            layout = self.get_layout(var)
+            if layout is None:
+                continue
+            key = (tuple(sorted(layout.items())), self.ds[var].shape, self.ds[var].dims)
+            if key not in checked:
+                checked[key] = (self.check_layout(var, layout), [])
+            checked[key][1].append(var)
+
+        if not checked:
+            self.results['storage_layout'] = -1
+            logging.info(
+                f"No storage layout information (the dataset is not read from a file)"
+            )
+            return
+
+        self.results['storage_layout'] = 0
+        for problems, variables in checked.values():
+            if problems:
+                self.results['storage_layout'] = 1
+                logging.error(
+                    f"Storage layout of {variables}: {'; '.join(problems)}"
+                )
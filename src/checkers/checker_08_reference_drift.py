@@ -0,0 +1,73 @@
+import logging
+
+from utils.misc_utils import get_time_years
+from utils.summary_utils import compare_summaries
+
+# Thresholds of the drift check (can be overridden with "reference_drift" in the config file, null: not checked)
+DEFAULT_REFERENCE_DRIFT = {
+    # Land mean (and 99% quantile) / the same of the reference for the same year (e.g. a unit factor of 100)
+    'max_mean_ratio': 10,
+    # Relative change of the land mean between two timesteps (1: doubling), unless the reference changes as much
+    'max_step_change': 1.0,
+    # Land cells / land cells of the reference for the same year
+    'min_count_ratio': 0.9,
+}
+
+
+class ReferenceDriftChecker:
+    """
+    Compare the summary of each timestep of the variables (land cells, land mean, quantiles)
+    with the summary of the reference file, computed once and cached (see ReferenceSummary)
+    """
+
+    def __init__(self, dschecker):
+
+        self.file = dschecker.file
+        self.ds = dschecker.ds
+        self.variable_list = dschecker.variable_list
+        self.get_variable_scan = dschecker.get_variable_scan
+        # The summaries of the reference are only comparable on its grid
+        self.reference_summary = dschecker.get_reference_summary(dschecker.file_type) if dschecker.on_reference_grid else None
+        self.thresholds = {**DEFAULT_REFERENCE_DRIFT, **(dschecker.reference_drift or {})}
+
+        self.results = {}
+
+    def summarize(self, var):
+        """
+        Summary of each timestep of a variable, from the pass over the data shared with the other checkers
+        (see VariableScan), from the nonzero cells for the sparse transitions
+        """
+        return self.get_variable_scan(var).summaries
+
+    def run_checker(self):
+        """
+        Run reference drift check
+        """
+        if self.reference_summary is None or 'time' not in self.ds.dims:
+            self.results['reference_drift'] = -1
+            logging.info(
+                f"No reference summary to compare with"
+            )
+            return
+
+        years = get_time_years(self.ds['time'])
+        self.results['reference_drift'] = 0
+        for var in self.variable_list:
+            if 'time' not in self.ds[var].dims or var not in self.reference_summary:
+                logging.info(
+                    f"    Variable {var} not compared with the reference"
+                )
+                continue
+
+            problems = compare_summaries(
+                years, self.summarize(var), self.reference_summary.get(var, years), self.thresholds
+            )
+            if problems:
+                self.results['reference_drift'] = 1
+                logging.error(
+                    f"Drift of {var} from the reference: {'; '.join(problems)}"
+                )
+            else:
+                logging.info(
+                    f"    {var} consistent with the reference"
+                )
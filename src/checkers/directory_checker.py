@@ -1,49 +1,85 @@
 from pathlib import Path
+from fnmatch import fnmatch
+from concurrent.futures import wait, FIRST_COMPLETED
+from collections import deque
+from math import prod
+import importlib
 import logging
 import json
 
-import numpy as np
-import xarray as xr
+# numpy, xarray and the checker modules are imported only when they are needed,
+# so that the entry points start fast (e.g. file name or config validation)
+from checkers.worker_pool import CheckerPool
 
-from checkers.checker_00_file_name import FileNameChecker
-from checkers.checker_01_standard_compliance import StandardComplianceChecker
-from checkers.checker_02_spatial_completeness import SpatialCompletenessChecker
-from checkers.checker_03_spatial_consistency import SpatialConsistencyChecker
-from checkers.checker_04_temporal_consistency import TemporalConsistencyChecker
-from checkers.checker_05_valid_ranges import ValidRangesChecker
-from checkers.checker_06_states_transitions import StatesTransitionsChecker
+from utils.path_utils import parse_file_name, log_file_name_info
+from utils.plan_utils import plan_files
+from utils.config_utils import VariableTable, NON_DATA_VARIABLES
+from utils.memory_utils import MB, CHECKER_TIMESTEPS, FileFootprint, MemoryBudget, plan_file, log_plan, FULL_LOAD
+from utils.misc_utils import parse_years_range, get_time_years
+from utils.log_utils import update_log_paths, ErrorCountHandler
+from utils.stream_utils import ResultsStream
+from utils.checkpoint_utils import read_checkpoint, write_checkpoint, clear_checkpoint
+from utils.shard_utils import parse_shard, get_shard_name, partition_tasks, find_shard_dirs
+from utils.isolation_utils import run_isolated, WORKER_OK, WORKER_TIMEOUT, \
+                                  WORKER_MEMORY, WORKER_EXCEPTION
+
+# Module and class of each checker, imported the first time the checker runs
+CHECKER_CLASSES = {
+    'file_name': ('checkers.checker_00_file_name', 'FileNameChecker'),
+    'standard_compliance': ('checkers.checker_01_standard_compliance', 'StandardComplianceChecker'),
+    'storage_layout': ('checkers.checker_07_storage_layout', 'StorageLayoutChecker'),
+    'spatial_completeness': ('checkers.checker_02_spatial_completeness', 'SpatialCompletenessChecker'),
+    'spatial_consistency': ('checkers.checker_03_spatial_consistency', 'SpatialConsistencyChecker'),
+    'temporal_consistency': ('checkers.checker_04_temporal_consistency', 'TemporalConsistencyChecker'),
+    'valid_ranges': ('checkers.checker_05_valid_ranges', 'ValidRangesChecker'),
+    'reference_drift': ('checkers.checker_08_reference_drift', 'ReferenceDriftChecker'),
+    'states_transitions': ('checkers.checker_06_states_transitions', 'StatesTransitionsChecker'),
+}
+
+
+def get_checker_class(checker_name):
+    module_name, class_name = CHECKER_CLASSES[checker_name]
+    return getattr(importlib.import_module(module_name), class_name)
 
-from utils.path_utils import get_file_type, get_activity_id, \
-                             get_dataset_category, get_target_mip, \
-                             get_source_id, get_grid_type, get_dates_range                          
-from utils.log_utils import update_log_paths
 
 class DirectoryChecker:
 
     def __init__(
-        self, directory, log_path='logs', 
+        self, directory=None, log_path='logs', 
         base_path='', references=None,
         flag_spatial_completeness=True, 
         flag_spatial_consistency=True,
         flag_temporal_consistency=True,
         flag_valid_ranges=True, 
         flag_states_transitions=True, 
+        flag_storage_layout=True,
+        flag_reference_drift=True,
         required_file_types=[], required_variables={}, required_coords={}, 
-        required_attributes=[], required_attributes_in_vars=[]
+        required_attributes=[], required_attributes_in_vars=[],
+        results_stream=None, resume_log_dir=None,
+        isolate_files=False, file_timeout=None, file_memory_limit=None, n_workers=0,
+        full_load_limit=None, memory_budget=None, read_block_size=64, sparse_transitions=False, shard=None,
+        grids=None, grid_tolerance=1.0e-6, time_schedules=None, storage_layout=None,
+        reference_drift=None, reference_cache_dir=None, histogram_bins=100, top_k_cells=5, diagnostics_dir=None,
+        select_files=None, select_variables=None, select_checkers=None, select_years=None
     ):
 
         # Set up basic logging
         logging.basicConfig(level='DEBUG')
 
         # Attributes defined in config
-        self.directory = Path(directory)
+        self.directory = Path(directory) if directory is not None else None
         self.references = references
-        self.reference_file = None 
+        self.reference = None  # Reference assets for the current file type
+        self.reference_cache = {}  # Reference assets by reference file path
+        self.reference_summaries = {}  # Summaries of the variables by reference file path (see ReferenceSummary)
+        self.variable_info = {}  # Content of variable-info.json by path
         self.log_root_dir = Path(log_path)
 
-        # Check directory existence
-        assert self.directory.exists(), f"Directory {self.directory} not found"
-        assert self.directory.is_dir(), f"{self.directory} is not a directory"
+        # Check directory existence (no directory when checking in-memory datasets)
+        if self.directory is not None:
+            assert self.directory.exists(), f"Directory {self.directory} not found"
+            assert self.directory.is_dir(), f"{self.directory} is not a directory"
 
         self.variable = None
         self.required_variables_all = required_variables
@@ -53,6 +89,13 @@ class DirectoryChecker:
         self.required_attributes_in_vars = required_attributes_in_vars
         self.required_file_types = required_file_types
         self.coordinate_list = None
+
+        # Variables of each file type (required, roles), shared by all checkers
+        self.variable_tables = {
+            file_type: VariableTable(file_type, required_variables.get(file_type, []), required_coords.get(file_type, []))
+            for file_type in set(required_variables) | set(required_coords)
+        }
+        self.variable_table = None
         
         self.activity_id = None 
         self.dataset_category = None 
@@ -63,7 +106,32 @@ class DirectoryChecker:
         self.expected_lon = []
         self.expected_lat = []
 
-        self.re_pattern = None
+        # Valid grids of each file type: the grid of the reference file and the grids of the config
+        self.grids = grids
+        self.grid_tolerance = grid_tolerance
+        self.grid_registry = None
+
+        # Spacing schedules of the timesteps by time category (see TemporalConsistencyChecker)
+        self.time_schedules = time_schedules
+
+        # Thresholds of StorageLayoutChecker
+        self.storage_layout = storage_layout
+
+        # Bins of the histograms of the values of each variable (see ValidRangesChecker), 0 or None: no histograms
+        self.histogram_bins = histogram_bins
+
+        # Cells kept for each failing variable and timestep of the data checks, with their coordinates (0: none)
+        self.top_k_cells = top_k_cells
+
+        # Maps of the failing slices of the current file, written to diagnostics_dir (None: not written)
+        self.diagnostics_dir = diagnostics_dir
+        self.diagnostics = None
+
+        # Thresholds of ReferenceDriftChecker, and directory of the cached reference summaries
+        self.reference_drift = reference_drift
+        self.reference_cache_dir = Path(reference_cache_dir) if reference_cache_dir else self.log_root_dir / 'reference_summaries'
+        self.reference_grids = set()  # File types whose reference grid is registered
+
 
         # Initialize other attributes
         self.file_counter = 0  # Number of files already checked
@@ -79,9 +147,13 @@ class DirectoryChecker:
         self.date_range = None
         # self.calendar = None  # netCDF attribute time:calendar
         self.checker_results = {}  # Nested dictionary to store check results
+        self.file_errors = {}  # Number of errors logged for each checked file
         self.variable_list = {}
         self.varname = ''
         self.file_name_corrected = ''
+        self.file_name_info = None
+        self.in_memory = False  # Checking an xarray dataset which is not (yet) a file
+        self.partner_states = None  # States dataset given for an in-memory transitions dataset
 
         # Flags for individual checks
         self.flag_file_name = True
@@ -91,8 +163,62 @@ class DirectoryChecker:
         self.flag_temporal_consistency = flag_temporal_consistency
         self.flag_valid_ranges = flag_valid_ranges
         self.flag_states_transitions = flag_states_transitions
+        self.flag_storage_layout = flag_storage_layout
+        self.flag_reference_drift = flag_reference_drift
         
         self.base_path = base_path
+
+        # Optional JSON-lines output (file or FIFO) with results as soon as they are available
+        self.results_stream_path = results_stream
+        self.results_stream = None
+        self.error_counter = ErrorCountHandler()
+
+        # Logging directory of an interrupted run to resume (completed files are skipped)
+        self.resume_log_dir = resume_log_dir
+        self.log_dir = None
+
+        # Check each file in a separate worker process with a timeout (s) and a memory cap (MB)
+        self.file_timeout = file_timeout
+        self.file_memory_limit = file_memory_limit
+        self.isolate_files = isolate_files or (file_timeout is not None) or (file_memory_limit is not None)
+
+        # Number of worker processes for run_checker (0: check the files in this process)
+        self.n_workers = n_workers
+
+        # Memory plan (MB in the config, bytes here): the data of a file is loaded once if full_load_limit is given
+        # and it fits in full_load_limit and memory_budget, otherwise it is read in blocks of read_block_size.
+        # The worker pool starts a file only while the estimated memory of the running files fits in memory_budget
+        self.full_load_limit = full_load_limit * MB if full_load_limit is not None else None
+        self.memory_budget = memory_budget * MB if memory_budget is not None else None
+        self.read_block_size = read_block_size * MB if read_block_size is not None else None
+        self.time_block = 1  # Number of timesteps of the current file read at once
+
+        # Transitions of the current file stored as their nonzero cells (see SparseField), shared by the checkers
+        self.sparse_transitions = sparse_transitions
+        self.sparse_fields = {}
+        self.nan_masks = {}
+
+        # Statistics of the timesteps of the variables of the current file, computed in one pass over
+        # the data of each variable and shared by the checkers which read the data (see VariableScan)
+        self.variable_scans = {}
+
+        # Whether the current file is on the grid of its reference file, whose masks and summaries
+        # apply only to this grid (a file on another valid grid of the config is checked without them)
+        self.on_reference_grid = True
+
+        # Shard of the directory checked by this run: (index, number of shards), None for all the files
+        self.shard = parse_shard(shard) if shard is not None else None
+
+        # Selectors for targeted re-checks (None: everything)
+        self.select_files = select_files  # Glob pattern for the file names
+        self.select_variables = select_variables  # List of variables
+        self.select_checkers = select_checkers  # List of checkers, e.g. ["valid_ranges", "states_transitions"]
+        self.select_years = parse_years_range(select_years) if select_years is not None else None
+        self.ds_all_times = None  # Dataset of the current file before the selection of years
+
+        if self.select_checkers is not None:
+            for name in self.select_checkers:
+                assert hasattr(self, f'flag_{name}'), f'Unknown checker {name}'
         
     # Read variable information for landuse files
     def read_variable_info(self, file_path):
@@ -100,36 +226,167 @@ class DirectoryChecker:
         Read information about a variable from a json file
         """
        
-        with open(file_path, 'r') as f:
-            
-            variables = json.load(f)[self.filename_firstpart]
-            
-            if list(variables.keys())==[]:
-                logging.info(
-                    f"No valid ranges information for the file {self.file}"
-                )
+        variables = self.get_variable_info(file_path)[self.filename_firstpart]
+        
+        if list(variables.keys())==[]:
+            logging.info(
+                f"No valid ranges information for the file {self.file}"
+            )
 
-            else:
+        else:
+            
+            for var in self.required_variables: 
+                if var in variables:
                 
-                for var in self.required_variables: 
-                    if var in list(variables.keys()):
-                    
-                        logging.info(
-                            f"Reading {var} variable boundary information from src/variable-info.json: "
-                            f"{variables[var]['boundaries']}"
-                            )
-                        self.boundaries[var] = variables[var]['boundaries']
-                    else:
-                        logging.info(
-                            f"Valid range of variable {var} is unknown - please set it in src/variable-info.json"
-                            )
-                for var in list(variables.keys()):
-                    if var not in self.required_variables:
-                        logging.info(
-                            f"Valid range of variable {var} is defined but the variable is not in the required variable list")
+                    logging.info(
+                        f"Reading {var} variable boundary information from src/variable-info.json: "
+                        f"{variables[var]['boundaries']}"
+                        )
+                    self.boundaries[var] = variables[var]['boundaries']
+                else:
+                    logging.info(
+                        f"Valid range of variable {var} is unknown - please set it in src/variable-info.json"
+                        )
+            for var in variables:
+                if var not in self.variable_table.required_set:
+                    logging.info(
+                        f"Valid range of variable {var} is defined but the variable is not in the required variable list")
         return       
     
+    def get_variable_info(self, file_path):
+        """
+        Return the content of a variable information json file, read once and kept for all the following files
+        """
+        if file_path not in self.variable_info:
+            with open(file_path, 'r') as f:
+                self.variable_info[file_path] = json.load(f)
+        return self.variable_info[file_path]
+
+    def get_reference(self, path):
+        """
+        Return the reference assets (grid and masks) of a reference file,
+        reading the file only the first time it is needed
+        """
+        if path not in self.reference_cache:
+            reference = self.read_reference(path)
+            if reference is None:
+                self.reference_cache[path] = None
+            else:
+                with reference:
+                    from utils.reference_utils import ReferenceAssets
+                    self.reference_cache[path] = ReferenceAssets.from_dataset(path, reference)
+
+        return self.reference_cache[path]
+
+    def get_reference_summary(self, file_type):
+        """
+        Return the summaries of the variables of the reference file of a file type, read from the cache
+        or computed from the reference the first time (None without reference)
+        """
+        path = self.references[file_type][0] if self.references and file_type in self.references else None
+        if path is None or not Path(path).is_file():
+            return None
+
+        if path not in self.reference_summaries:
+            from utils.summary_utils import ReferenceSummary, get_cache_path
+            cache_path = get_cache_path(self.reference_cache_dir, path)
+            summary = None
+            if cache_path.is_file():
+                try:
+                    summary = ReferenceSummary.load(path, cache_path)
+                except (OSError, ValueError, KeyError) as e:
+                    logging.warning(
+                        f"Cached reference summary {cache_path} can not be read ({e}), computing it again"
+                    )
+
+            if summary is None:
+                reference = self.read_reference(path)
+                if reference is not None:
+                    with reference:
+                        summary = ReferenceSummary.from_dataset(path, reference)
+                    try:
+                        summary.save(cache_path)
+                    except OSError as e:
+                        logging.warning(
+                            f"Reference summary can not be cached in {cache_path}: {e}"
+                        )
+            self.reference_summaries[path] = summary
+
+        return self.reference_summaries[path]
+
+    def needs_summaries(self):
+        """
+        Whether the summaries of the timesteps of the current file are compared with a reference
+        """
+        return (
+            self.is_enabled('reference_drift') and self.on_reference_grid
+            and self.get_reference_summary(self.file_type) is not None
+        )
+
+    def get_variable_table(self, file_type):
+        """
+        Return the variable table of a file type (empty for a file type without requirements)
+        """
+        if file_type not in self.variable_tables:
+            self.variable_tables[file_type] = VariableTable(file_type)
+        return self.variable_tables[file_type]
+
+    def get_grid_registry(self, file_type=None):
+        """
+        Return the registry of the valid grids, with the grid of the reference file of file_type
+        """
+        if self.grid_registry is None:
+            from utils.grid_utils import GridRegistry
+            self.grid_registry = GridRegistry(self.grid_tolerance)
+            self.grid_registry.register_config(self.grids)
+
+        if file_type is not None and file_type not in self.reference_grids:
+            path = self.references[file_type][0] if self.references and file_type in self.references else None
+            reference = self.get_reference(path) if path else None
+            if reference:
+                from utils.grid_utils import GridSpec
+                self.grid_registry.register(
+                    file_type, GridSpec(f'reference {Path(path).name}', reference.lat, reference.lon, self.grid_tolerance)
+                )
+            self.reference_grids.add(file_type)
+
+        return self.grid_registry
+
+    def warm_up(self, forking=True):
+        """
+        Load the enabled checkers and the reference assets of all required file types
+        in advance (e.g. before forking worker processes, which then share them).
+        forking is False if the files are checked in this process
+        """
+        for checker_name in CHECKER_CLASSES:
+            if checker_name == 'file_name' or self.is_enabled(checker_name):
+                get_checker_class(checker_name)
+
+        for file_type in self.required_file_types:
+            if self.references and file_type in self.references:
+                self.get_reference(self.references[file_type][0])
+            if self.is_enabled('spatial_consistency'):
+                self.get_grid_registry(file_type)
+            if self.is_enabled('reference_drift'):
+                self.get_reference_summary(file_type)
+
+        variable_info_path = self.base_path + '/src/variable-info.json'
+        if Path(variable_info_path).is_file():
+            self.get_variable_info(variable_info_path)
+
+        # The grids and masks of the references are shared by the workers without copies
+        if forking:
+            for reference in self.reference_cache.values():
+                if reference is not None:
+                    reference.share()
+
+        # Compile the kernels of the data checks once (if numba is installed)
+        if self.data_checkers():
+            from utils import kernel_utils
+            kernel_utils.warm_up(parallel=not forking)
+
     def read_reference(self, path):
+        import xarray as xr
 
         reference = None
         try:
@@ -146,177 +403,875 @@ class DirectoryChecker:
         return reference
 
 
-    def run_checker(self):
+    def run_single_checker(self, checker_name):
+        """
+        Run one checker on the current file, store its results and stream them
+        """
+        n_errors_before = self.error_counter.count
+        chk = get_checker_class(checker_name)(self)
+        chk.run_checker()
+        self.checker_results[self.file.name] = {
+            **self.checker_results[self.file.name], **chk.results
+            }
+
+        if self.results_stream:
+            self.results_stream.emit_result(
+                self.file.name, checker_name, chk.results,
+                self.error_counter.count - n_errors_before
+            )
+
+
+    def start_run(self, rolling=None, restore=False, run_name=None):
+        """
+        Set up the logs, the results stream and restore the checkpoint of a resumed run
+        (or of the previous runs in the rolling log directory if restore).
+        run_name gives a fixed logging directory to the run (e.g. a shard), whose previous checkpoint is removed.
+        Return the checkpoint: {file name: record} of the files already checked
+        """
         
-        # Set up logging directories
-        update_log_paths(self.log_root_dir, self.directory)
+        # Set up logging directories (named after the directory, if any)
+        log_name_dir = self.directory if self.directory is not None else Path('check_file')
+        self.log_dir = update_log_paths(
+            self.log_root_dir, log_name_dir, self.resume_log_dir, rolling, run_name
+        )
+        if run_name and self.resume_log_dir is None and not rolling:
+            clear_checkpoint(self.log_dir)
+
+        # Restore the results of the files completed before the interruption
+        checkpoint = {}
+        if (self.resume_log_dir is not None) or restore:
+            checkpoint = read_checkpoint(self.log_dir)
+            for file_name, record in checkpoint.items():
+                self.checker_results[file_name] = record['results']
+                if record['fill_value'] is not None:
+                    self.fill_value = record['fill_value']
+            logging.info(
+                f'Resuming the run in {self.log_dir}: {len(checkpoint)} file(s) already checked'
+            )
+
+        # Count errors to report them per checker in the results stream
+        logging.getLogger().addHandler(self.error_counter)
+
+        if self.results_stream_path:
+            self.results_stream = ResultsStream(self.results_stream_path)
+
+        return checkpoint
+
+
+    def end_run(self):
+        """
+        Close the results stream and the diagnostics, and free the shared memory of the reference assets
+        """
+        if self.results_stream:
+            self.results_stream.close()
+            self.results_stream = None
+        self.close_diagnostics()
+
+        for reference in self.reference_cache.values():
+            if reference is not None:
+                reference.unshare()
+
+
+    def run_checker(self):
+
+        checkpoint = self.start_run(run_name=get_shard_name(*self.shard) if self.shard else None)
 
         # Count files
-        list_files = list(self.directory.iterdir())
-        list_files.sort()
+        list_files = self.list_files()
         n_files = len(list_files)
 
-        for file in list_files:
+        # Group the files by scenario (states, transitions and management files are checked together)
+        units, other_files = plan_files(list_files, self.required_file_types)
+        if self.shard:
+            units, other_files = self.select_shard(units, other_files)
+            n_files = sum(len(unit.files) for unit in units) + len(other_files)
+        for unit in units:
+            for file_type, file in list(unit.files.items()):
+                if file.name in checkpoint:
+                    del unit.files[file_type]
+        units = [unit for unit in units if unit.files]
+        other_files = [f for f in other_files if f.name not in checkpoint]
+        if checkpoint:
+            self.file_counter += len(checkpoint)
+            logging.info(
+                f'Skipping {len(checkpoint)} of {n_files} file(s) already checked'
+            )
+
+        try:
+            if self.n_workers > 0:
+                self.run_units_in_pool(units, other_files, n_files)
+            else:
+                if self.isolate_files:
+                    # Each file is checked in a forked process: compile the kernels only once
+                    self.warm_up()
+                for unit in units:
+                    self.check_unit(unit, n_files)
+                    for file in unit.ordered_files():
+                        self.save_checkpoint(file.name)
+
+                for file in other_files:
+                    self.run_file(file, n_files)
+                    self.save_checkpoint(file.name)
+        finally:
+            self.end_run()
+
+
+    def list_files(self):
+        """
+        Sorted entries of the directory selected for the run
+        """
+        list_files = list(self.directory.iterdir())
+        if self.select_files is not None:
+            list_files = [f for f in list_files if fnmatch(f.name, self.select_files)]
+        return sorted(list_files)
+
+
+    def partition_shards(self, units, other_files, count):
+        """
+        Split the scenario units and the other files into count shards balanced by size.
+        Return ({task key: size}, [task keys of each shard]).
+        The shards do not depend on the files already checked
+        """
+        tasks = {f'unit {unit.key}': unit for unit in units}
+        tasks.update({f'file {file.name}': file for file in other_files})
+        sizes = {
+            key: task.size() if key.startswith('unit') else task.stat().st_size
+            for key, task in tasks.items()
+        }
+        return sizes, partition_tasks(sizes, count)
+
+
+    def select_shard(self, units, other_files):
+        """
+        Keep the scenario units and the other files of the shard of this run
+        """
+        index, count = self.shard
+        sizes, shards = self.partition_shards(units, other_files, count)
+
+        keys = set(shards[index])
+        units = [unit for unit in units if f'unit {unit.key}' in keys]
+        other_files = [file for file in other_files if f'file {file.name}' in keys]
+
+        logging.info(
+            f'Shard {index}/{count}: {len(units)} scenario(s) and {len(other_files)} other file(s), '
+            f'{sum(sizes[key] for key in keys) / MB:.1f} MB of {sum(sizes.values()) / MB:.1f} MB'
+        )
+        return units, other_files
+
+
+    def merge_shards(self, n_shards=None):
+        """
+        Combine the checkpoints of the shard runs of the directory into one run
+        (logging directory "<directory>___merged"), with the _FillValue consistency check
+        across all the files. The files of the directory are planned again as in the shard runs:
+        the planned files which are in no checkpoint (missing or interrupted shards) are reported.
+        Return the report of the merge (also written to report.json)
+        """
+        n_shards, shard_dirs = find_shard_dirs(self.log_root_dir, self.directory.name, n_shards)
+        self.start_run(run_name='merged')
+
+        try:
+            shard_files = {}
+            duplicates = []
+            n_file_errors = 0
+            for index, shard_dir in shard_dirs.items():
+                checkpoint = read_checkpoint(shard_dir)
+                shard_files[index] = len(checkpoint)
+                for file_name, record in sorted(checkpoint.items()):
+                    if file_name in self.checker_results:
+                        duplicates.append(file_name)
+                        logging.error(
+                            f'File {file_name} found in several shards, keeping the results of shard {index}'
+                        )
+                    else:
+                        n_file_errors += record.get('n_errors') or 0
+                    self.merge_file_results(
+                        file_name, record['results'], record['fill_value'], record.get('n_errors')
+                    )
+                    self.save_checkpoint(file_name)
+
+            missing = [index for index in range(n_shards) if index not in shard_dirs]
+            if missing:
+                logging.error(
+                    f'Missing shard(s) {missing} of {n_shards}: their files are not in the merged results'
+                )
+
+            # Files planned for each shard which were not checked
+            units, other_files = plan_files(self.list_files(), self.required_file_types)
+            tasks = {f'unit {unit.key}': unit.ordered_files() for unit in units}
+            tasks.update({f'file {file.name}': [file] for file in other_files})
+            unchecked = {}
+            for index, keys in enumerate(self.partition_shards(units, other_files, n_shards)[1] if n_shards else []):
+                names = [f.name for key in keys for f in tasks[key] if f.name not in self.checker_results]
+                if names:
+                    unchecked[index] = sorted(names)
+                    if index not in missing:
+                        logging.error(
+                            f'Shard {index} of {n_shards} is incomplete: {len(names)} planned file(s) not checked, '
+                            f'e.g. {names[0]}'
+                        )
+
+            report = {
+                'directory': str(self.directory),
+                'n_shards': n_shards,
+                'shard_dirs': {index: str(d) for index, d in shard_dirs.items()},
+                'shard_files': shard_files,
+                'missing_shards': missing,
+                'unchecked_files': unchecked,
+                'n_files': len(self.checker_results),
+                'duplicate_files': duplicates,
+                'fill_value': self.fill_value,
+                # Errors logged while checking the files, and while merging
+                'n_errors': n_file_errors + self.error_counter.count,
+            }
+            with open(self.log_dir / 'report.json', 'w') as f:
+                json.dump(report, f, indent=1)
+            logging.info(
+                f'Merged {len(self.checker_results)} file(s) of {len(shard_dirs)} shard(s) in {self.log_dir}'
+            )
+        finally:
+            self.end_run()
+
+        return report
+
+
+    def run_units_in_pool(self, units, other_files, n_files):
+        """
+        Check the scenario units in parallel worker processes (each unit on one worker)
+        """
+        # Load the reference assets once, before the workers are forked
+        self.warm_up()
+
+        # Estimated memory of each task, read from the headers (only needed with a memory budget)
+        tasks = deque(
+            [('unit', unit, self.estimate_memory(unit.ordered_files())) for unit in units]
+            + [('file', file, self.estimate_memory([file])) for file in other_files]
+        )
+        budget = MemoryBudget(self.memory_budget)
+        pool = CheckerPool(self, self.n_workers)
+
+        try:
+            running = {}
+            while tasks or running:
+                # Start the next tasks while a worker is free and their memory fits in the budget
+                while tasks and len(running) < self.n_workers and budget.can_admit(tasks[0][2]):
+                    kind, item, n_bytes = tasks.popleft()
+                    future = pool.submit_unit(item, n_files) if kind == 'unit' else pool.submit(item, n_files)
+                    budget.admit(n_bytes)
+                    running[future] = n_bytes
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    budget.release(running.pop(future))
+                    file_results = future.result()
+                    if not isinstance(file_results, list):
+                        file_results = [file_results]
+                    for file_name, results, fill_value, n_errors in file_results:
+                        self.merge_file_results(file_name, results, fill_value, n_errors)
+                        self.save_checkpoint(file_name)
+        finally:
+            pool.shutdown()
+
+
+    def data_checkers(self):
+        """
+        Enabled checkers which read the data of the variables
+        """
+        return [name for name in CHECKER_TIMESTEPS if self.is_enabled(name)]
+
+
+    def estimate_memory(self, files):
+        """
+        Estimated peak memory (bytes) of the checks of files checked one after the other by the same worker
+        (e.g. a scenario unit), read from their headers. The states file of a unit stays open while its
+        transitions file is checked (see check_unit): its data counts in the working set of the transitions file.
+        0 without a memory budget; a file which can not be opened is not counted
+        """
+        if self.memory_budget is None:
+            return 0
+
+        import xarray as xr
+
+        working_sets = {}
+        states_bytes = 0
+        for file in files:
+            try:
+                with xr.open_dataset(file, decode_times=False) as ds:
+                    variables = [v for v in ds.variables if v not in NON_DATA_VARIABLES]
+                    if self.select_variables is not None:
+                        variables = [v for v in variables if v in self.select_variables]
+                    footprint = FileFootprint.from_dataset(ds, variables)
+            except Exception:
+                # The error is reported when the file is checked
+                continue
+            strategy, time_block = plan_file(footprint, self.full_load_limit, self.memory_budget, self.read_block_size)
+            file_type = parse_file_name(file.name).file_type
+            working_sets[file_type] = footprint.working_set(strategy, self.data_checkers(), time_block)
+            if file_type == 'multiple-states':
+                # Loaded once, the states stay in memory, otherwise a block is read for each block of transitions
+                states_bytes = footprint.n_bytes if strategy == FULL_LOAD else time_block * footprint.timestep_bytes
+
+        if 'multiple-transitions' in working_sets and not self.isolate_files:
+            working_sets['multiple-transitions'] += states_bytes
+        return max(working_sets.values(), default=0)
+
+
+    def save_checkpoint(self, file_name):
+        """
+        Append the results of a completed file to the checkpoint of the run
+        """
+        write_checkpoint(
+            self.log_dir, file_name,
+            self.checker_results[file_name], self.fill_value, n_errors=self.file_errors.get(file_name)
+        )
+
+
+    def check_paths(self, paths, write_logs=False):
+        """
+        Check the given files directly, without listing a directory.
+        The log files are written only if write_logs (otherwise messages go to the current logging setup).
+        Return {path: results}
+        """
+        if write_logs:
+            self.start_run()
+        else:
+            logging.getLogger().addHandler(self.error_counter)
+
+        results = {}
+        try:
+            for path in paths:
+                file = Path(path)
+                if not file.exists():
+                    logging.error(
+                        f'File {file} does not exist'
+                    )
+                    self.file_errors[file.name] = 1
+                    continue
+                results[str(path)], _ = self.run_file(file, len(paths))
+        finally:
+            if write_logs:
+                self.end_run()
+            else:
+                logging.getLogger().removeHandler(self.error_counter)
+
+        return results
+
+
+    def run_file(self, file, n_files):
+        """
+        Check a file (in an isolated worker if configured).
+        Return its results and the _FillValue seen so far
+        """
+        if self.isolate_files:
+            self.check_file_isolated(file, n_files)
+        else:
+            self.check_file(file, n_files)
+        return self.checker_results[file.name], self.fill_value
+
+
+    def merge_file_results(self, file_name, results, fill_value, n_errors=None):
+        """
+        Store the results (and the number of errors) of a file checked by another process
+        and check that its _FillValue is consistent with the files checked before
+        """
+        self.checker_results[file_name] = results
+        if n_errors is not None:
+            self.file_errors[file_name] = n_errors
+
+        if fill_value is not None:
+            if self.fill_value is None:
+                self.fill_value = fill_value
+            elif abs(fill_value - self.fill_value) > 1.0e-5:
+                logging.error(
+                    f'Inconsistent value for netcdf key _FillValue in file {file_name}: '
+                    f'{fill_value} (previous files: {self.fill_value})'
+                )
+
+
+    def check_file_in_worker(self, file, n_files):
+        """
+        Check a file in a forked process and return the state needed by the parent process
+        """
+        from utils import kernel_utils
+        kernel_utils.use_serial_kernels()
+
+        self.check_file(file, n_files)
+        return self.checker_results[file.name], self.fill_value, self.file_errors[file.name]
+
+
+    def check_file_isolated(self, file, n_files):
+        """
+        Check a file in an isolated worker process, so that a file which hangs or crashes
+        the netCDF/HDF5 libraries is recorded as failed and the run continues with the next file
+        """
+        status, value = run_isolated(
+            self.check_file_in_worker, (file, n_files),
+            timeout=self.file_timeout, memory_limit=self.file_memory_limit
+        )
+        self.file_counter += 1
+        self.file = file
+        self.last_checked_file = file
+
+        if status == WORKER_OK:
+            results, self.fill_value, self.file_errors[file.name] = value
+            self.checker_results[file.name] = {**results, 'worker_status': status}
+            return
+
+        if status == WORKER_TIMEOUT:
+            logging.error(
+                f'Checking file {file.name} exceeded the timeout of {self.file_timeout} s. Skipping this file'
+            )
+        elif status == WORKER_MEMORY:
+            logging.error(
+                f'Checking file {file.name} exceeded the memory limit of {self.file_memory_limit} MB. Skipping this file'
+            )
+        elif status == WORKER_EXCEPTION:
+            logging.error(
+                f'Unexpected error while checking file {file.name}. Skipping this file\n{value}'
+            )
+        else:
+            logging.error(
+                f'Worker crashed while checking file {file.name}. Skipping this file'
+            )
+
+        self.checker_results[file.name] = {'worker_status': status}
+        self.file_errors[file.name] = 1
+        if self.results_stream:
+            self.results_stream.emit_result(file.name, 'worker', self.checker_results[file.name], 1)
+            self.results_stream.emit_file_done(file.name, 1)
+
+
+    def open_dataset(self, file):
+        """
+        Open a netCDF file (without decoding the times if they can not be decoded)
+        """
+        import xarray as xr
+
+        try:
+            ds =xr.open_dataset(file.absolute())
+                
+        except:
+            ds =xr.open_dataset(file.absolute(), decode_times=False)
+            ds['calendar'] = '365_day'
+            ds['_FillValue'] = 1e20
+
+        return ds
+
+
+    def check_unit(self, unit, n_files):
+        """
+        Check the files of a scenario unit. The states dataset is opened once
+        and used both for its own checks and for the check of the transitions file
+        """
+        files = unit.ordered_files()
+        states_file = unit.files.get('multiple-states')
+        transitions_file = unit.files.get('multiple-transitions')
+
+        states_ds = None
+        if states_file is not None and transitions_file is not None and not self.isolate_files:
+            try:
+                states_ds = self.open_dataset(states_file)
+            except Exception:
+                # The error is reported when the states file is checked
+                states_ds = None
+
+        if states_ds is None:
+            for file in files:
+                self.run_file(file, n_files)
+            return
+
+        with states_ds:
+            for file in files:
+                self.partner_states = states_ds if file == transitions_file else None
+                self.check_file(file, n_files, ds=states_ds if file == states_file else None)
+            self.partner_states = None
+
+
+    def check_unit_in_worker(self, unit, n_files):
+        """
+        Check a scenario unit and return [(file name, results, _FillValue seen, number of errors)] for the parent process
+        """
+        self.check_unit(unit, n_files)
+        return [
+            (f.name, self.checker_results[f.name], self.fill_value, self.file_errors.get(f.name))
+            for f in unit.ordered_files()
+        ]
+
+
+    def check_file(self, file, n_files, ds=None):
+        """
+        Run all enabled checkers on a single file.
+        ds is the dataset of the file if it is already opened (it is not closed here)
+        """
             
-            self.file = file
+        self.file = file
+        self.file_counter += 1
+        self.checker_results[file.name] = {}
+        
+        progress = f'{self.file_counter}/{n_files}' if n_files else f'{self.file_counter}'
+        logging.error(
+            f'\n\n------------------------------------------------------------------------------------------------------------------\n'
+            f'      Checking file {progress}: {file.name}\n'
+            f'      ------------------------------------------------------------------------------------------------------------------\n'
+            f'\n\n'
+            )
+        n_errors_before = self.error_counter.count
+
+        file_extension = str(self.file)[-3:]
+        if (file_extension != '.nc'):
+            logging.error(
+                f'File {self.file} is not a NetCDF file. Skipping all tests on this file'
+            )
+        elif self.prepare_file():
+
+            if ds is not None:
+                self.check_contents(ds)
+            else:
+                with self.open_dataset(file) as ds:
+                    self.check_contents(ds)
+
+        self.file_errors[file.name] = self.error_counter.count - n_errors_before
+        if self.results_stream:
+            self.results_stream.emit_file_done(
+                file.name, self.file_errors[file.name]
+            )
+        
+        # Track information
+        self.last_checked_file = self.file
+
+
+    def check_dataset(self, ds, file_type, name, states=None):
+        """
+        Run all enabled checkers on an in-memory xarray dataset, e.g. before it is written to disk.
+        name is the name of the file the dataset would be written to (it is checked as a file name),
+        file_type is "multiple-management", "multiple-states" or "multiple-transitions".
+        For "multiple-transitions", the corresponding states dataset can be given in states.
+        Return the results of the checks
+        """
+        self.in_memory = True
+        self.partner_states = states
+        self.file = Path(name)
+        self.checker_results[self.file.name] = {}
+
+        try:
+            if self.prepare_file(file_type):
+                self.check_contents(ds)
+        finally:
+            self.in_memory = False
+            self.partner_states = None
+
+        return self.checker_results[self.file.name]
+
+
+    def prepare_file(self, file_type=None):
+        """
+        Check the name of the current file and set up the information for its file type.
+        Return True if the content of the file can be checked
+        """
             
-            self.file_name_corrected = file.name
-            if '__' in self.file_name_corrected:
-                self.file_name_corrected = self.file_name_corrected.replace('__','-')
-            if '_off-' in self.file_name_corrected:
-                self.file_name_corrected = self.file_name_corrected.replace('_off','-off')
-            if '_on-' in self.file_name_corrected:
-                self.file_name_corrected = self.file_name_corrected.replace('_on','-')
-                
+        self.file_name_info = parse_file_name(self.file.name, self.required_file_types)
+        self.file_name_corrected = self.file_name_info.corrected_name
             
-            self.file_counter += 1
-            self.checker_results[file.name] = {}
+        self.varname = self.file_name_info.varname
+        self.file_type = self.file_name_info.file_type
+        self.filename_firstpart = self.file_name_info.first_part
+        logging.info(f'Variable name will be checked for the file type {self.file_type}')
+        if file_type is not None:
+            self.file_type = self.filename_firstpart = file_type
+        
+        self.run_single_checker('file_name')
+
+        file_type_counter = self.checker_results[self.file.name]['file_name']
+        if file_type_counter:
+            return False
             
-            logging.error(
-                f'\n\n------------------------------------------------------------------------------------------------------------------\n'
-                f'      Checking file {self.file_counter}/{n_files}: {file.name}\n'
-                f'      ------------------------------------------------------------------------------------------------------------------\n'
-                f'\n\n'
-                )
+        if 'multiple' not in self.file_type:
+            logging.warning(
+                f'File {self.file} is not a landuse file. Skipping all tests on this file'
+            )    
+            return False
 
-            file_extension = str(self.file)[-3:]
-            if (file_extension != '.nc'):
-                logging.error(
-                    f'File {self.file} is not a NetCDF file. Skipping all tests on this file'
+        self.data_source = 'landuse'
+        self.variable_table = self.get_variable_table(self.file_type)
+        self.required_variables = self.variable_table.required
+        self.read_variable_info(
+            self.base_path + '/src/variable-info.json'
+        )
+    
+        
+        self.coordinate_list = list(self.variable_table.coords)
+        
+        log_file_name_info(self.file_name_info)
+        self.activity_id = self.file_name_info.activity_id
+        self.dataset_category = self.file_name_info.dataset_category
+        self.target_mip = self.file_name_info.target_mip
+        self.source_id = self.file_name_info.source_id
+        self.grid_type = self.file_name_info.grid_type
+        self.date_range = self.file_name_info.dates_range
+        
+        self.reference = self.get_reference(self.references[self.file_type][0]) 
+            
+        if self.reference:
+            self.expected_lat = self.reference.lat
+            self.expected_lon = self.reference.lon
+        self.get_grid_registry(self.file_type)
+        
+        return self.is_valid
+
+
+    def is_enabled(self, checker_name):
+        """
+        Return True if the checker is enabled by its flag and selected
+        """
+        if not getattr(self, f'flag_{checker_name}'):
+            return False
+        return self.select_checkers is None or checker_name in self.select_checkers
+
+
+    def select_time(self, ds):
+        """
+        Restrict a dataset to the selected years (lazily: only these timesteps are read)
+        """
+        if self.select_years is None or 'time' not in ds.dims:
+            return ds
+
+        import numpy as np
+
+        first_year, last_year = self.select_years
+        years = get_time_years(ds['time'])
+        indices = np.nonzero((years >= first_year) & (years <= last_year))[0]
+        logging.info(
+            f"Checking only the years {first_year}-{last_year}: {len(indices)} of {len(years)} timesteps"
+        )
+        return ds.isel(time=indices)
+
+
+    def plan_memory(self):
+        """
+        Choose how the data of the current file is read (see plan_file): the selected variables
+        are loaded once for all checkers, or each checker reads them in blocks of timesteps
+        """
+        checkers = self.data_checkers()
+        if not checkers or 'time' not in self.ds.dims:
+            self.time_block = 1
+            return
+
+        # The transitions read as sparse fields are not loaded (see get_sparse_field)
+        variables = [v for v in self.variable_list if not self.uses_sparse_field(v)]
+
+        footprint = FileFootprint.from_dataset(self.ds, variables)
+        strategy, self.time_block = plan_file(
+            footprint, self.full_load_limit, self.memory_budget, self.read_block_size
+        )
+        log_plan(
+            self.file.name, footprint, strategy, self.time_block,
+            footprint.working_set(strategy, checkers, self.time_block)
+        )
+
+        if strategy == FULL_LOAD:
+            # Loaded in place: the dataset of the file is shared by all checkers
+            for var in variables:
+                self.ds[var].variable.load()
+
+
+    def matches_reference_grid(self):
+        """
+        Return True if the current dataset is on the grid of its reference file (or if there is no reference).
+        Without coordinates (reported by SpatialConsistencyChecker), only the number of cells is compared
+        """
+        if not self.reference:
+            return True
+
+        lat, lon = (
+            next((self.ds[name].values for name in names if name in self.ds.variables), None)
+            for names in (('lat', 'latitude'), ('lon', 'longitude'))
+        )
+        if lat is not None and lon is not None:
+            matches = self.reference.matches_grid(lat, lon, self.grid_tolerance)
+        else:
+            n_cells = {
+                prod(self.ds.sizes[dim] for dim in self.ds[var].dims if dim != 'time') for var in self.variable_list
+            }
+            matches = n_cells <= {self.reference.lat.size * self.reference.lon.size}
+
+        if not matches:
+            logging.warning(
+                f"{self.file.name} is not on the grid of the reference file {self.reference.path}: "
+                f"the checks with the reference masks and summaries are skipped"
+            )
+        return matches
+
+
+    def uses_sparse_field(self, var):
+        """
+        Return True if the variable of the current file is read as a sparse field
+        """
+        return (
+            self.sparse_transitions and self.variable_table is not None
+            and self.variable_table.get_role(var) == 'transition' and 'time' in self.ds[var].dims
+        )
+
+
+    def get_land_mask(self, var):
+        """
+        Return the mask of the cells where NaNs are expected for a variable of the current file
+        (from the reference, see ReferenceAssets) and the reference variable it is taken from.
+        None without mask: not a landuse file, no reference or not on its grid
+        """
+        if self.data_source != 'landuse' or not self.reference or not self.on_reference_grid:
+            return None, None
+        return self.reference.get_mask(var)
+
+
+    def get_variable_scan(self, var):
+        """
+        Return the statistics of the timesteps of a variable of the current file (see VariableScan),
+        computed the first time a checker needs them: the checkers which read the data use one pass.
+        The histogram is filled only for the valid ranges check, the summaries only for the reference drift check
+        """
+        if var not in self.variable_scans:
+            from utils.scan_utils import VariableScan
+            from utils.histogram_utils import Histogram
+
+            mask = self.get_land_mask(var)[0] if self.is_enabled('spatial_completeness') else None
+            histogram = None
+            if self.is_enabled('valid_ranges') and self.histogram_bins and var in (self.boundaries or {}):
+                histogram = Histogram.for_valid_range(*self.boundaries[var], self.histogram_bins)
+            summaries = self.needs_summaries()
+
+            if self.uses_sparse_field(var):
+                scan = VariableScan.from_sparse_field(self.get_sparse_field(var), mask, histogram, summaries)
+            else:
+                scan = VariableScan.from_data_array(self.ds[var], self.time_block, mask, histogram, summaries)
+            self.variable_scans[var] = scan
+
+        return self.variable_scans[var]
+
+
+    def get_sparse_field(self, var):
+        """
+        Return the nonzero cells of a transition of the current file, reading the variable
+        the first time it is needed
+        """
+        if var not in self.sparse_fields:
+            from utils.sparse_utils import SparseField
+            self.sparse_fields[var] = SparseField.from_data_array(self.ds[var], self.time_block, self.nan_masks)
+        return self.sparse_fields[var]
+
+
+    def open_diagnostics(self):
+        """
+        Start the diagnostics of the current file (the file is created with the first failing slice)
+        """
+        self.close_diagnostics()
+        if self.diagnostics_dir is not None and 'time' in self.ds.variables:
+            try:
+                from utils.diagnostics_utils import DiagnosticsWriter
+                import netCDF4
+            except ImportError:
+                logging.warning(
+                    f"netCDF4 is not installed: no diagnostics are written"
                 )
-            else:            
-                
-                self.varname, self.file_type, self.filename_firstpart = get_file_type(self.file_name_corrected) 
+                self.diagnostics_dir = None
+                return
+            self.diagnostics = DiagnosticsWriter(
+                Path(self.diagnostics_dir) / f'{Path(self.file.name).stem}_diagnostics.nc', self.ds['time']
+            )
+
+
+    def close_diagnostics(self):
+        if self.diagnostics is not None:
+            self.diagnostics.close()
+            self.diagnostics = None
+
+
+    def check_contents(self, ds):
+        """
+        Run the enabled checkers on the opened dataset of the current file
+        """
                 
-                chk = FileNameChecker(self)
-                chk.run_checker()
-                self.checker_results[file.name] = {
-                    **self.checker_results[file.name], **chk.results
-                    }
-
-                file_type_counter = self.checker_results[file.name]['file_name']
-                if (not file_type_counter):
-                    
-                    if 'multiple' in self.file_type:
-                        self.data_source = 'landuse'
-                        self.required_variables = self.required_variables_all[self.file_type]
-                        self.read_variable_info(
-                            self.base_path + '/src/variable-info.json'
-                        )
-                    
-                        
-                        self.coordinate_list = self.required_coords[self.file_type] 
-                        
-                        self.activity_id = get_activity_id(self.file_name_corrected) 
-                        self.dataset_category = get_dataset_category(self.file_name_corrected) 
-                        self.target_mip = get_target_mip(self.file_name_corrected)  
-                        self.source_id = get_source_id(self.file_name_corrected)  
-                        self.grid_type = get_grid_type(self.file_name_corrected)  
-                        self.date_range = get_dates_range(self.file_name_corrected) 
-                        
-                        self.reference_file = self.read_reference(self.references[self.file_type][0]) 
-                            
-                        if self.reference_file:
-                            self.expected_lat = self.reference_file.lat.values
-                            self.expected_lon = self.reference_file.lon.values
-                        
-                        
-                        if self.is_valid: 
-                            
-                            try:
-                                ds =xr.open_dataset(file.absolute())
-                                    
-                            except:
-                                ds =xr.open_dataset(file.absolute(), decode_times=False)
-                                ds['calendar'] = '365_day'
-                                ds['_FillValue'] = 1e20
-                                
-                            with ds:
-                                
-                                # Store xarray dataset
-                                self.ds = ds
-                                self.variable_list = list(ds.variables.keys())
-                                vars_to_remove = ['longitude', 'lon', 'lon_bnds', 'lon_bounds', \
-                                                'latitude', 'lat', 'lat_bnds', 'lat_bounds', 'crs', 'calendar', \
-                                                '_FillValue', 'missing_value', 'time', 'time_bnds', 'time_bounds', \
-                                                'gas', 'sector', 'sector_bnds', 'sector_bounds', 'year', 'month', \
-                                                'unit', 'method', 'level', 'level_bnds', 'bounds_lon', 'bounds_lat', 'bounds_time']
-                                self.variable_list = [v for v in self.variable_list if v not in vars_to_remove]
-                               
-                                for var in self.required_variables:
-                                    if var not in self.variable_list:
-                                        logging.error(
-                                            f"Missing compulsory variable {var} as indicated in config.json"
-                                            )
-
-
-                                if self.flag_standard_compliance:
-                                    logging.info(
-                                        f"Check: standard compliance"
-                                    )
-                                    chk = StandardComplianceChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-
-                                if self.flag_spatial_completeness:
-                                    logging.info(
-                                        f"Check: spatial completeness"
-                                    )
-                                    chk = SpatialCompletenessChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-
-                                if self.flag_spatial_consistency:
-                                    logging.info(
-                                        f'Check: spatial consistency'
-                                    )
-                                    chk = SpatialConsistencyChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-
-                                if self.flag_temporal_consistency:
-                                    logging.info(
-                                        f'Check: temporal consistency'
-                                    )
-                                    chk = TemporalConsistencyChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-
-                                if self.flag_valid_ranges:
-                                    logging.info(
-                                        f'Check: valid ranges'
-                                    )
-                                    chk = ValidRangesChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-                                    
-                                if self.flag_states_transitions:
-                                    logging.info(
-                                        f'Check for landuse: sum of the gross landuse transitions should match the difference in states between two consecutive years'
-                                    )
-                                    chk = StatesTransitionsChecker(self)
-                                    chk.run_checker()
-                                    self.checker_results[file.name] = {
-                                        **self.checker_results[file.name], **chk.results
-                                        }
-                                    
-                    else:
-                        
-                        logging.warning(
-                            f'File {self.file} is not a landuse file. Skipping all tests on this file'
-                        )    
+        # Store xarray dataset
+        self.ds_all_times = ds
+        self.ds = self.select_time(ds)
+        self.sparse_fields = {}
+        self.nan_masks = {}
+        self.variable_scans = {}
+        self.open_diagnostics()
+        self.variable_list = self.variable_table.data_variables(ds.variables.keys())
+       
+        for var in self.variable_table.missing_variables(self.variable_list):
+            logging.error(
+                f"Missing compulsory variable {var} as indicated in config.json"
+                )
+
+        if self.select_variables is not None:
+            self.variable_list = [v for v in self.variable_list if v in self.select_variables]
+            logging.info(
+                f"Checking only the selected variables: {self.variable_list}"
+            )
+
+        self.plan_memory()
+        self.on_reference_grid = self.matches_reference_grid()
+
+
+        if self.is_enabled('standard_compliance'):
+            logging.info(
+                f"Check: standard compliance"
+            )
+            self.run_single_checker('standard_compliance')
+
+        if self.is_enabled('storage_layout'):
+            logging.info(
+                f"Check: storage layout"
+            )
+            self.run_single_checker('storage_layout')
+
+        if self.is_enabled('spatial_completeness'):
+            logging.info(
+                f"Check: spatial completeness"
+            )
+            self.run_single_checker('spatial_completeness')
+
+        if self.is_enabled('spatial_consistency'):
+            logging.info(
+                f'Check: spatial consistency'
+            )
+            self.run_single_checker('spatial_consistency')
+
+        if self.is_enabled('temporal_consistency'):
+            logging.info(
+                f'Check: temporal consistency'
+            )
+            self.run_single_checker('temporal_consistency')
+
+        if self.is_enabled('valid_ranges'):
+            logging.info(
+                f'Check: valid ranges'
+            )
+            self.run_single_checker('valid_ranges')
+
+        if self.is_enabled('reference_drift'):
+            logging.info(
+                f'Check: reference drift'
+            )
+            self.run_single_checker('reference_drift')
             
-            # Track information
-            self.last_checked_file = self.file
+        if self.is_enabled('states_transitions'):
+            logging.info(
+                f'Check for landuse: sum of the gross landuse transitions should match the difference in states between two consecutive years'
+            )
+            self.run_single_checker('states_transitions')
+
+        if self.sparse_fields:
+            fields = list(self.sparse_fields.values())
+            logging.info(
+                f"Sparse transitions: {len(fields)} variable(s), mean density "
+                f"{sum(f.density() for f in fields) / len(fields):.3f}, {sum(f.nbytes for f in fields) / MB:.1f} MB"
+            )
+
+        # The sparse fields of the file are not needed any more
+        self.sparse_fields = {}
+        self.nan_masks = {}
+        self.variable_scans = {}
+        self.close_diagnostics()
 
-                            
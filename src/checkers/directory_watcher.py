@@ -0,0 +1,151 @@
+import time
+import logging
+from fnmatch import fnmatch
+
+from checkers.worker_pool import CheckerPool
+from utils.checkpoint_utils import write_checkpoint
+
+
+class DirectoryWatcher:
+    """
+    Long-lived (daemon) mode: poll the directory of a DirectoryChecker and check
+    the files which are new or changed, once they have stopped growing.
+    Changes are detected with os.stat (size and modification time) only.
+    """
+
+    def __init__(self, dschecker, poll_interval=60, settle_time=30, n_workers=0):
+        self.dschecker = dschecker
+        self.poll_interval = poll_interval  # Seconds between two scans of the directory
+        self.settle_time = settle_time  # Seconds without change before a file is checked
+        self.n_workers = n_workers  # 0: check the files in the daemon process itself
+
+        self.checked = {}  # {file name: (size, mtime) when it was checked}
+        self.pending = {}  # {file name: ((size, mtime), time when this signature was first seen)}
+        self.running = {}  # {future: (file name, signature)}
+        self.pool = None
+
+    def scan(self):
+        """
+        Return {file name: (size, mtime)} for the regular files of the directory
+        """
+        signatures = {}
+        for file in self.dschecker.directory.iterdir():
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            select_files = self.dschecker.select_files
+            if file.is_file() and (select_files is None or fnmatch(file.name, select_files)):
+                signatures[file.name] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def get_ready_files(self, signatures, now):
+        """
+        Return the new or changed files whose size and mtime did not change for settle_time
+        """
+        ready = []
+        in_progress = {name for name, _ in self.running.values()}
+
+        for name, signature in signatures.items():
+            if self.checked.get(name) == signature or name in in_progress:
+                continue
+
+            if name in self.pending and self.pending[name][0] == signature:
+                if now - self.pending[name][1] >= self.settle_time:
+                    ready.append((name, signature))
+                    del self.pending[name]
+            else:
+                self.pending[name] = (signature, now)
+
+        # Forget files removed before they settled, and the removed files already checked
+        for name in list(self.pending):
+            if name not in signatures:
+                del self.pending[name]
+        for name in list(self.checked):
+            if name not in signatures:
+                del self.checked[name]
+
+        return sorted(ready)
+
+    def record(self, file_name, signature, results, fill_value, n_errors=None):
+        """
+        Append the results of a checked file to the checkpoint (its _FillValue is compared with the files
+        checked before). The results are then dropped from the checker: they are in the checkpoint
+        (and the results stream), so the memory of the daemon does not grow with the files checked
+        """
+        self.dschecker.merge_file_results(file_name, results, fill_value, n_errors)
+        self.checked[file_name] = signature
+        write_checkpoint(
+            self.dschecker.log_dir, file_name, results, self.dschecker.fill_value, signature,
+            n_errors=self.dschecker.file_errors.get(file_name)
+        )
+        self.dschecker.checker_results.pop(file_name, None)
+        self.dschecker.file_errors.pop(file_name, None)
+
+    def check_files(self, ready):
+        """
+        Check the ready files, in the pool if there is one
+        """
+        for name, signature in ready:
+            file = self.dschecker.directory / name
+            logging.info(
+                f'Watch: new or changed file {name}'
+            )
+            if self.pool is not None:
+                self.running[self.pool.submit(file)] = (name, signature)
+            else:
+                results, fill_value = self.dschecker.run_file(file, None)
+                self.record(name, signature, results, fill_value)
+
+    def collect(self):
+        """
+        Record the results of the files finished by the pool
+        """
+        for future in [f for f in self.running if f.done()]:
+            name, signature = self.running.pop(future)
+            try:
+                file_name, results, fill_value, n_errors = future.result()
+            except Exception as e:
+                logging.error(
+                    f'Worker failed while checking file {name}: {e}'
+                )
+                continue
+            self.record(file_name, signature, results, fill_value, n_errors)
+
+    def run(self, max_polls=None):
+        """
+        Poll the directory until interrupted (or max_polls scans)
+        """
+        checkpoint = self.dschecker.start_run(rolling='watch', restore=True)
+        for file_name, record in checkpoint.items():
+            if record.get('signature') is not None:
+                self.checked[file_name] = tuple(record['signature'])
+            # Only the signatures are kept, the results stay in the checkpoint
+            self.dschecker.checker_results.pop(file_name, None)
+
+        # Load the reference assets once, before the workers are forked
+        self.dschecker.warm_up(forking=self.n_workers > 0)
+        if self.n_workers > 0:
+            self.pool = CheckerPool(self.dschecker, self.n_workers)
+
+        logging.info(
+            f'Watching {self.dschecker.directory} every {self.poll_interval} s '
+            f'({len(self.checked)} file(s) already checked)'
+        )
+
+        n_polls = 0
+        try:
+            while max_polls is None or n_polls < max_polls:
+                self.collect()
+                self.check_files(self.get_ready_files(self.scan(), time.time()))
+                n_polls += 1
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            logging.info(
+                f'Watch of {self.dschecker.directory} interrupted'
+            )
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.collect()
+            self.dschecker.end_run()
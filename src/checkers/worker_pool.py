@@ -0,0 +1,112 @@
+import signal
+import logging
+import logging.handlers
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# DirectoryChecker of the worker process (inherited from the parent when the worker is forked)
+_worker_checker = None
+
+
+def init_worker(dschecker, log_queue):
+    """
+    Keep the checker of the worker, use the single-threaded kernels
+    and send its log messages to the parent process
+    """
+    global _worker_checker
+    _worker_checker = dschecker
+
+    # The kernels compiled by the parent before the fork (see DirectoryChecker.warm_up)
+    from utils import kernel_utils
+    kernel_utils.use_serial_kernels()
+
+    # Ctrl-C is handled by the parent process, which shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    log = logging.getLogger()
+    for handler in log.handlers[:]:
+        log.removeHandler(handler)
+    log.addHandler(logging.handlers.QueueHandler(log_queue))
+    log.addHandler(dschecker.error_counter)
+
+
+def check_file_in_worker(file, n_files, flags=None, independent=False):
+    """
+    Check a file in a worker process and return (file name, results, _FillValue seen, number of errors).
+    flags ({'flag_...': bool}) override the checker flags for this file only.
+    If independent, the file is not compared with the files checked before by this worker
+    """
+    file = Path(file)
+
+    saved_flags = {}
+    for flag, value in (flags or {}).items():
+        saved_flags[flag] = getattr(_worker_checker, flag)
+        setattr(_worker_checker, flag, value)
+    if independent:
+        _worker_checker.fill_value = None
+
+    try:
+        results, fill_value = _worker_checker.run_file(file, n_files)
+    finally:
+        for flag, value in saved_flags.items():
+            setattr(_worker_checker, flag, value)
+
+    # The parent keeps the results: the memory of a long-lived worker stays bounded
+    _worker_checker.checker_results.pop(file.name, None)
+    n_errors = _worker_checker.file_errors.pop(file.name, None)
+
+    return file.name, results, fill_value, n_errors
+
+
+def check_unit_in_worker(unit, n_files):
+    """
+    Check a scenario unit in a worker process and return [(file name, results, _FillValue seen, number of errors)]
+    """
+    file_results = _worker_checker.check_unit_in_worker(unit, n_files)
+    for file_name, *_ in file_results:
+        _worker_checker.checker_results.pop(file_name, None)
+        _worker_checker.file_errors.pop(file_name, None)
+    return file_results
+
+
+class CheckerPool:
+    """
+    Persistent pool of worker processes checking files with a copy of a DirectoryChecker.
+    The workers are forked from the parent, so the reference assets already loaded
+    in the parent are shared, and each worker keeps its caches warm between files.
+    The log messages of the workers go through the handlers of the parent process.
+    """
+
+    def __init__(self, dschecker, n_workers):
+        context = multiprocessing.get_context('fork')
+        self.log_queue = context.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=n_workers, mp_context=context,
+            initializer=init_worker, initargs=(dschecker, self.log_queue)
+        )
+
+        # Fork the workers now, before other threads (log listener, server) are started
+        self.executor.submit(int).result()
+
+        self.log_listener = logging.handlers.QueueListener(
+            self.log_queue, *logging.getLogger().handlers, respect_handler_level=True
+        )
+        self.log_listener.start()
+
+    def submit(self, file, n_files=None, flags=None, independent=False):
+        """
+        Schedule the check of a file. The future returns (file name, results, _FillValue seen, number of errors)
+        """
+        return self.executor.submit(check_file_in_worker, str(file), n_files, flags, independent)
+
+    def submit_unit(self, unit, n_files=None):
+        """
+        Schedule the check of all files of a scenario unit on the same worker.
+        The future returns [(file name, results, _FillValue seen, number of errors)]
+        """
+        return self.executor.submit(check_unit_in_worker, unit, n_files)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+        self.log_listener.stop()
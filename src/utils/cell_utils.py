@@ -0,0 +1,54 @@
+import numpy as np
+
+
+def top_k_indices(scores, k) -> np.ndarray:
+    """
+    Flat indices of the k largest non-NaN scores, largest first (np.argpartition: no full sort)
+    """
+    scores = np.asarray(scores, dtype=np.float64).ravel()
+    scores = np.where(np.isnan(scores), -np.inf, scores)
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    indices = np.argpartition(scores, -k)[-k:]
+    indices = indices[np.argsort(-scores[indices], kind='stable')]
+    return indices[scores[indices] > -np.inf]
+
+
+def cell_coords(data_array):
+    """
+    Coordinates of the cells of one timestep of a variable: {dim: values}
+    (the indices for a dimension without coordinate)
+    """
+    return {
+        dim: data_array[dim].values if dim in data_array.coords else np.arange(data_array.sizes[dim])
+        for dim in data_array.dims if dim != 'time'
+    }
+
+
+def worst_cells(scores, k, coords, time=None, **fields):
+    """
+    Records of the k cells with the largest scores (e.g. the distance to the valid range) of a timestep:
+    their coordinates, the time and the values of fields (arrays of the shape of the timestep)
+    """
+    indices = top_k_indices(scores, k)
+    positions = np.unravel_index(indices, tuple(len(values) for values in coords.values()))
+    records = []
+    for n, index in enumerate(indices):
+        record = {} if time is None else {'time': float(time)}
+        for (dim, values), position in zip(coords.items(), positions):
+            record[dim] = float(values[position[n]])
+        for name, field in fields.items():
+            record[name] = float(np.ravel(field)[index])
+        records.append(record)
+    return records
+
+
+def format_cells(records, value='value'):
+    """
+    Short text of the records for the logs, e.g. "(lat=10.5, lon=-3.5): 1.2"
+    """
+    return ', '.join(
+        '(' + ', '.join(f'{key}={v:g}' for key, v in record.items() if key not in ('time', 'value', 'delta')) + f'): {record[value]:.3g}'
+        for record in records
+    )
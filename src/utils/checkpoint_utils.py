@@ -0,0 +1,76 @@
+import os
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+from utils.stream_utils import to_builtin
+
+CHECKPOINT_FILE_NAME = 'checkpoint.jsonl'
+
+
+def write_checkpoint(log_dir: Path, file_name: str, results: Dict, fill_value=None, signature=None, n_errors=None):
+    """
+    Append the results of a completed file to the checkpoint of the run.
+    Each file is one JSON line written with a single call and synced to disk,
+    so after a crash a record is either complete or (last line only) incomplete and dropped.
+    """
+    record = {
+        'file': file_name,
+        'results': results,
+        'fill_value': fill_value
+    }
+    if signature is not None:
+        # (size, mtime) of the file when it was checked (watch mode)
+        record['signature'] = signature
+    if n_errors is not None:
+        # Errors logged while checking the file (summed by the merge of the shards)
+        record['n_errors'] = n_errors
+    line = json.dumps(record, default=to_builtin) + '\n'
+
+    with open(Path(log_dir) / CHECKPOINT_FILE_NAME, 'a') as f:
+        f.write(line)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def clear_checkpoint(log_dir: Path):
+    """
+    Remove the checkpoint of a previous run in a reused logging directory
+    """
+    checkpoint_path = Path(log_dir) / CHECKPOINT_FILE_NAME
+    if checkpoint_path.exists():
+        checkpoint_path.unlink()
+
+
+def read_checkpoint(log_dir: Path) -> Dict:
+    """
+    Read the results of the files completed in a previous run:
+    {file name: {'file': ..., 'results': ..., 'fill_value': ...}}
+    """
+    checkpoint = {}
+    checkpoint_path = Path(log_dir) / CHECKPOINT_FILE_NAME
+
+    if not checkpoint_path.exists():
+        logging.warning(
+            f'No checkpoint found in {log_dir}: all files will be checked'
+        )
+        return checkpoint
+
+    with open(checkpoint_path, 'rb+') as f:
+        content = f.read()
+
+        # Drop a record interrupted while being written so that new records start on a new line
+        n_complete = content.rfind(b'\n') + 1
+        if n_complete < len(content):
+            logging.warning(
+                f'Ignoring incomplete checkpoint record in {checkpoint_path}'
+            )
+            f.truncate(n_complete)
+
+    for line in content[:n_complete].decode().splitlines():
+        if line.strip():
+            record = json.loads(line)
+            checkpoint[record['file']] = record
+
+    return checkpoint
@@ -0,0 +1,129 @@
+import logging
+from typing import Dict, Iterable, List
+
+from utils.misc_utils import check_config_file
+
+# The config is compiled before logging is set up: a logger of the module does not set up the root logger
+# (logging.warning would, at the WARNING level, and the INFO messages of the run would be dropped)
+logger = logging.getLogger(__name__)
+
+# Coordinates, bounds and other variables which are not checked as data
+NON_DATA_VARIABLES = frozenset([
+    'longitude', 'lon', 'lon_bnds', 'lon_bounds',
+    'latitude', 'lat', 'lat_bnds', 'lat_bounds', 'crs', 'calendar',
+    '_FillValue', 'missing_value', 'time', 'time_bnds', 'time_bounds',
+    'gas', 'sector', 'sector_bnds', 'sector_bounds', 'year', 'month',
+    'unit', 'method', 'level', 'level_bnds', 'bounds_lon', 'bounds_lat', 'bounds_time'
+])
+
+# States which are not area fractions (secondary mean age and biomass)
+NON_FRACTION_STATES = frozenset(['secma', 'secmb'])
+
+# Primary and secondary natural vegetation states
+NATURAL_STATES = frozenset(['primf', 'primn', 'secdf', 'secdn'])
+
+# Config keys holding lists which should not contain duplicates
+LIST_KEYS = ['required_file_types', 'required_attributes', 'required_attributes_in_vars']
+LIST_BY_FILE_TYPE_KEYS = ['required_variables', 'required_coords']
+
+
+def get_variable_role(file_type: str, var: str) -> str:
+    """
+    Role of a variable in a file of the given type:
+    coordinate, state, natural_state, non_fraction_state, transition, harvest or data
+    """
+    if var in NON_DATA_VARIABLES:
+        return 'coordinate'
+    if file_type == 'multiple-states':
+        if var in NON_FRACTION_STATES:
+            return 'non_fraction_state'
+        if var in NATURAL_STATES:
+            return 'natural_state'
+        return 'state'
+    if file_type == 'multiple-transitions':
+        if '_to_' in var:
+            return 'transition'
+        if var.endswith('_harv') or var.endswith('_bioh'):
+            return 'harvest'
+    return 'data'
+
+
+def dedupe(values: Iterable, name: str) -> List:
+    """
+    Remove the duplicates of a list, keeping the order
+    """
+    values = list(values)
+    unique = list(dict.fromkeys(values))
+    if len(unique) < len(values):
+        duplicates = sorted({v for v in values if values.count(v) > 1})
+        logger.warning(
+            f'Duplicate entries in {name}: {duplicates}'
+        )
+    return unique
+
+
+class VariableTable:
+    """
+    Variables of a file type, computed once from the config and shared by all checkers
+    """
+
+    def __init__(self, file_type, required_variables=(), required_coords=()):
+        self.file_type = file_type
+        self.required = tuple(dict.fromkeys(required_variables))
+        self.required_set = frozenset(self.required)
+        self.coords = tuple(dict.fromkeys(required_coords))
+        self.roles = {var: get_variable_role(file_type, var) for var in self.required}
+
+    def get_role(self, var) -> str:
+        if var not in self.roles:
+            self.roles[var] = get_variable_role(self.file_type, var)
+        return self.roles[var]
+
+    def data_variables(self, names) -> List[str]:
+        """
+        Names which are not coordinates, in their order
+        """
+        return [v for v in names if v not in NON_DATA_VARIABLES]
+
+    def variables_with_role(self, names, *roles) -> List[str]:
+        return [v for v in names if self.get_role(v) in roles]
+
+    def missing_variables(self, names) -> List[str]:
+        """
+        Required variables which are not in names
+        """
+        names = set(names)
+        return [v for v in self.required if v not in names]
+
+
+def get_transition_index(names) -> Dict[str, tuple]:
+    """
+    For each state, the transitions from and to it: {state: ([state_to_X], [X_to_state])}
+    """
+    index = {}
+    for name in names:
+        if '_to_' not in name:
+            continue
+        source, target = name.split('_to_', 1)
+        index.setdefault(source, ([], []))[0].append(name)
+        index.setdefault(target, ([], []))[1].append(name)
+    return index
+
+
+def compile_config(config: Dict, known_keys=None) -> Dict:
+    """
+    Validate the config once (see check_config_file) and remove the duplicates of its lists
+    """
+    config = check_config_file(config, known_keys)
+
+    for key in LIST_KEYS:
+        if key in config:
+            config[key] = dedupe(config[key], key)
+
+    for key in LIST_BY_FILE_TYPE_KEYS:
+        config[key] = {
+            file_type: dedupe(values, f'{key}["{file_type}"]')
+            for file_type, values in config.get(key, {}).items()
+        }
+
+    return config
@@ -0,0 +1,87 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from utils.misc_utils import get_time_years
+
+# Maps of the failing slices: netCDF type and fill value (slices which were not written)
+DIAGNOSTIC_MAPS = {
+    'nan_locations': ('i1', -1),  # 1: unexpected NaN, 0: value or expected NaN
+    'delta': ('f4', np.float32(np.nan)),  # e.g. delta of the states vs transitions, sum of the states - 1
+}
+
+DIAGNOSTICS_COMPLEVEL = 4
+
+
+class DiagnosticsWriter:
+    """
+    Maps of the failing (variable, timestep) slices of a file, appended to one netCDF file
+    with "variable" and "time" dimensions. Each map is chunked by slice and compressed: only the written
+    slices take space, and a slice is written to the file as soon as it is found (nothing is kept in memory).
+    The file is created with the first slice (no file for a file without failure)
+    """
+
+    def __init__(self, path, time):
+        self.path = Path(path)
+        self.time = time  # Time coordinate of the checked dataset
+        self.nc = None
+        self.dims = None
+        self.shape = None
+        self.variables = {}  # Index of each variable name
+        self.n_slices = 0
+
+    def open(self, coords):
+        import netCDF4
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.nc = netCDF4.Dataset(self.path, 'w')
+        # Only "variable" is unlimited: the records of netCDF-4 files with several unlimited dimensions can be misplaced
+        self.nc.createDimension('variable', None)
+        self.nc.createDimension('time', self.time.size)
+        self.nc.createVariable('variable', str, ('variable',))
+
+        # The time as in the file when it is not decoded, otherwise the years
+        time = self.nc.createVariable('time', 'f8', ('time',))
+        if np.issubdtype(self.time.dtype, np.number):
+            time.setncatts({k: v for k, v in self.time.attrs.items() if isinstance(v, (str, int, float))})
+            time[:] = self.time.values
+        else:
+            time.units = 'year'
+            time[:] = get_time_years(self.time)
+
+        for dim, values in coords.items():
+            self.nc.createDimension(dim, len(values))
+            self.nc.createVariable(dim, 'f8', (dim,))[:] = values
+        self.dims = tuple(coords)
+        self.shape = tuple(len(values) for values in coords.values())
+
+    def write(self, kind, var, t, values, coords):
+        """
+        Write the map (kind, see DIAGNOSTIC_MAPS) of variable var at timestep t.
+        coords are the coordinates of the cells of the map: {dim: values}
+        """
+        if self.nc is None:
+            self.open(coords)
+
+        if kind not in self.nc.variables:
+            dtype, fill_value = DIAGNOSTIC_MAPS[kind]
+            self.nc.createVariable(
+                kind, dtype, ('variable', 'time') + self.dims, fill_value=fill_value,
+                zlib=True, complevel=DIAGNOSTICS_COMPLEVEL, shuffle=True, chunksizes=(1, 1) + self.shape
+            )
+
+        if var not in self.variables:
+            self.variables[var] = len(self.variables)
+            self.nc['variable'][self.variables[var]] = var
+
+        self.nc[kind][self.variables[var], t] = np.asarray(values).reshape(self.shape)
+        self.n_slices += 1
+
+    def close(self):
+        if self.nc is not None:
+            self.nc.close()
+            self.nc = None
+            logging.info(
+                f'Diagnostics: {self.n_slices} failing slice(s) of {len(self.variables)} variable(s) written to {self.path}'
+            )
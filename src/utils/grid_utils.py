@@ -0,0 +1,116 @@
+import hashlib
+import logging
+
+import numpy as np
+
+# Two coordinates closer than this (in degrees) are the same
+GRID_TOLERANCE = 1.0e-6
+
+
+def canonical_axis(values) -> np.ndarray:
+    """
+    Coordinate values as ascending float64 (a grid may be stored north to south)
+    """
+    values = np.asarray(values, dtype=np.float64).ravel()
+    if values.size > 1 and values[0] > values[-1]:
+        values = values[::-1]
+    return values
+
+
+def grid_fingerprint(lat, lon, tolerance=GRID_TOLERANCE) -> str:
+    """
+    Hash of the canonical lat/lon, rounded to the tolerance
+    """
+    digest = hashlib.sha1()
+    for axis in (lat, lon):
+        quantized = np.round(canonical_axis(axis) / tolerance).astype(np.int64)
+        digest.update(str(quantized.size).encode())
+        digest.update(quantized.tobytes())
+    return digest.hexdigest()
+
+
+class GridSpec:
+    """
+    A known grid: its name, canonical lat/lon and fingerprint
+    """
+
+    def __init__(self, name, lat, lon, tolerance=GRID_TOLERANCE):
+        self.name = name
+        self.lat = canonical_axis(lat)
+        self.lon = canonical_axis(lon)
+        self.tolerance = tolerance
+        self.fingerprint = grid_fingerprint(self.lat, self.lon, tolerance)
+
+    @classmethod
+    def from_config(cls, spec, tolerance=GRID_TOLERANCE):
+        """
+        Regular grid given in the config as
+        {"name": "0.25deg gn", "resolution": 0.25, "lat_bounds": [-90, 90], "lon_bounds": [-180, 180]}
+        (the coordinates are the centers of the cells)
+        """
+        resolution = spec['resolution']
+        lat_min, lat_max = spec.get('lat_bounds', [-90, 90])
+        lon_min, lon_max = spec.get('lon_bounds', [-180, 180])
+        lat = np.arange(lat_min + resolution / 2, lat_max, resolution)
+        lon = np.arange(lon_min + resolution / 2, lon_max, resolution)
+        return cls(spec.get('name', f'{resolution}deg'), lat, lon, tolerance)
+
+    def matches(self, lat, lon) -> bool:
+        """
+        Full comparison, within the tolerance
+        """
+        lat = canonical_axis(lat)
+        lon = canonical_axis(lon)
+        return (
+            lat.shape == self.lat.shape and lon.shape == self.lon.shape
+            and np.allclose(lat, self.lat, rtol=0, atol=self.tolerance)
+            and np.allclose(lon, self.lon, rtol=0, atol=self.tolerance)
+        )
+
+
+class GridRegistry:
+    """
+    Valid grids of each file type. A grid is matched by its fingerprint first,
+    and compared with the known grids only if the fingerprint is not known
+    """
+
+    def __init__(self, tolerance=GRID_TOLERANCE):
+        self.tolerance = tolerance
+        self.grids = {}  # {file type: [GridSpec]}
+
+    def register(self, file_type, grid):
+        grids = self.grids.setdefault(file_type, [])
+        if all(g.fingerprint != grid.fingerprint for g in grids):
+            grids.append(grid)
+            logging.info(
+                f'Grid {grid.name} ({grid.lat.size} x {grid.lon.size}) registered for {file_type}'
+            )
+
+    def register_config(self, grids):
+        """
+        Register the grids of the config: {file type: [grid spec]}
+        """
+        for file_type, specs in (grids or {}).items():
+            for spec in specs:
+                self.register(file_type, GridSpec.from_config(spec, self.tolerance))
+
+    def get_grids(self, file_type):
+        return self.grids.get(file_type, [])
+
+    def match(self, file_type, lat, lon):
+        """
+        Return the known grid of the file type matching lat/lon, None if there is none
+        """
+        grids = self.get_grids(file_type)
+
+        fingerprint = grid_fingerprint(lat, lon, self.tolerance)
+        for grid in grids:
+            if grid.fingerprint == fingerprint:
+                return grid
+
+        # Values on the edge of a rounding step have another fingerprint
+        for grid in grids:
+            if grid.matches(lat, lon):
+                return grid
+
+        return None
@@ -0,0 +1,156 @@
+import numpy as np
+
+# Bins of the histograms of the values (see ValidRangesChecker)
+N_BINS = 100
+
+# Logarithmic bins of the values of the variables without an upper bound (e.g. fertilizer in kg/ha)
+LOG_RANGE = (1.0e-6, 1.0e6)
+
+# Quantiles reported for each variable
+HISTOGRAM_QUANTILES = [0.01, 0.5, 0.99]
+
+
+class Histogram:
+    """
+    Histogram of the values of a variable, filled block by block in one pass (np.bincount).
+    The bins are linear between the valid bounds, or logarithmic when a bound is missing; the values
+    outside the bins are counted in an underflow and an overflow bin. The values beyond the limits
+    of the valid range are counted exactly. Histograms with the same bins can be merged
+    """
+
+    def __init__(self, lo, hi, n_bins=N_BINS, log=False, low_limit=None, high_limit=None):
+        self.lo, self.hi = float(lo), float(hi)  # Range of the bins (log10 of the values for log bins)
+        self.n_bins = n_bins
+        self.log = log
+        self.scale = n_bins / (self.hi - self.lo)
+        self.low_limit = low_limit
+        self.high_limit = high_limit
+
+        self.counts = np.zeros(n_bins + 2, dtype=np.int64)  # Underflow, bins, overflow
+        self.n_nans = 0
+        self.below = 0  # Values < low_limit
+        self.above = 0  # Values > high_limit
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def for_bounds(cls, min_value, max_value, n_bins=N_BINS, low_limit=None, high_limit=None):
+        if min_value is not None and max_value is not None and max_value > min_value:
+            return cls(min_value, max_value, n_bins, False, low_limit, high_limit)
+        return cls(np.log10(LOG_RANGE[0]), np.log10(LOG_RANGE[1]), n_bins, True, low_limit, high_limit)
+
+    @classmethod
+    def for_valid_range(cls, min_value, max_value, n_bins=N_BINS):
+        """
+        Histogram of a variable with a valid range, counting the values out of the range
+        with the tolerances of ValidRangesChecker
+        """
+        low_limit = high_limit = None
+        if min_value is not None:
+            low_limit = min_value if min_value == 0 else min_value - (0.0001 + 0.0001 * abs(min_value))
+        if max_value is not None:
+            high_limit = max_value + (1e-08 + 0.0001 * abs(max_value))
+        return cls.for_bounds(min_value, max_value, n_bins, low_limit, high_limit)
+
+    @property
+    def n_values(self) -> int:
+        return int(self.counts.sum())
+
+    def edges(self) -> np.ndarray:
+        edges = np.linspace(self.lo, self.hi, self.n_bins + 1)
+        return 10**edges if self.log else edges
+
+    def bin_index(self, values) -> np.ndarray:
+        """
+        Index of the bin of each value (0: underflow, n_bins + 1: overflow), the upper edge is in the last bin
+        """
+        if self.log:
+            # Zero and negative values are in the underflow bin
+            positive = values > 0
+            logs = np.full(values.shape, -np.inf)
+            logs[positive] = np.log10(values[positive])
+            values = logs
+        position = (values - self.lo) * self.scale
+        index = np.floor(np.clip(position, -1, self.n_bins + 1)).astype(np.int64) + 1
+        index[position == self.n_bins] = self.n_bins
+        return np.minimum(index, self.n_bins + 1)
+
+    def add(self, values, n_zeros=0, n_nans=0):
+        """
+        Add a block of values (any shape, NaNs are counted apart), with n_zeros zeros and n_nans NaNs
+        which are not in the block (e.g. the cells of a sparse field)
+        """
+        values = np.asarray(values).ravel()
+        nan = np.isnan(values)
+        self.n_nans += int(np.count_nonzero(nan)) + n_nans
+        if nan.any():
+            values = values[~nan]
+
+        if values.size:
+            self.counts += np.bincount(self.bin_index(values), minlength=self.counts.size)
+            if self.low_limit is not None:
+                self.below += int(np.count_nonzero(values < self.low_limit))
+            if self.high_limit is not None:
+                self.above += int(np.count_nonzero(values > self.high_limit))
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+
+        if n_zeros:
+            self.counts[self.bin_index(np.zeros(1))[0]] += n_zeros
+            if self.low_limit is not None and 0 < self.low_limit:
+                self.below += n_zeros
+            if self.high_limit is not None and 0 > self.high_limit:
+                self.above += n_zeros
+            self.min = min(self.min, 0.0)
+            self.max = max(self.max, 0.0)
+
+    def merge(self, other):
+        """
+        Add the counts of a histogram with the same bins (e.g. of the same variable in another file)
+        """
+        if (other.lo, other.hi, other.n_bins, other.log) != (self.lo, self.hi, self.n_bins, self.log):
+            raise ValueError('Histograms with different bins can not be merged')
+        self.counts += other.counts
+        self.n_nans += other.n_nans
+        self.below += other.below
+        self.above += other.above
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantiles(self, qs=HISTOGRAM_QUANTILES) -> np.ndarray:
+        """
+        Approximate quantiles, interpolated linearly in their bin (exact within the width of a bin)
+        """
+        n_values = self.n_values
+        if not n_values:
+            return np.full(len(qs), np.nan)
+
+        edges = self.edges()
+        lows = np.concatenate([[self.min], edges])
+        highs = np.concatenate([edges, [self.max]])
+        cumulative = np.cumsum(self.counts)
+
+        quantiles = []
+        for q in qs:
+            rank = max(q * n_values, 0.5)
+            i = min(int(np.searchsorted(cumulative, rank)), self.counts.size - 1)
+            fraction = (rank - (cumulative[i] - self.counts[i])) / self.counts[i]
+            quantiles.append(lows[i] + fraction * (highs[i] - lows[i]))
+        return np.clip(quantiles, self.min, self.max)
+
+    def to_dict(self):
+        """
+        Compact form of the histogram (only the nonzero bins) for the results of a file
+        """
+        nonzero = np.flatnonzero(self.counts)
+        return {
+            'bins': [self.lo, self.hi, self.n_bins, 'log' if self.log else 'linear'],
+            'counts': [[int(i), int(self.counts[i])] for i in nonzero],
+            'n_nans': self.n_nans,
+            'min': self.min if self.n_values else None,
+            'max': self.max if self.n_values else None,
+            'quantiles': [float(q) for q in self.quantiles()] if self.n_values else None,
+            'below': self.below,
+            'above': self.above,
+        }
@@ -0,0 +1,67 @@
+import logging
+import resource
+import traceback
+import multiprocessing
+
+# Result codes of a run in an isolated worker
+WORKER_OK = 0
+WORKER_TIMEOUT = 1  # Wall-clock timeout exceeded, the worker was killed
+WORKER_CRASH = 2  # The worker died without returning (e.g. segfault in the HDF5 library)
+WORKER_MEMORY = 3  # Memory limit exceeded
+WORKER_EXCEPTION = 4  # Unexpected Python exception in the worker
+
+
+def _run_target(conn, target, args, memory_limit):
+    """
+    Entry point of the worker process: apply the memory cap, run target and send back its result
+    """
+    if memory_limit is not None:
+        # Cap the address space of the worker (in MB)
+        limit = int(memory_limit * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    try:
+        conn.send((WORKER_OK, target(*args)))
+    except MemoryError:
+        conn.send((WORKER_MEMORY, None))
+    except Exception:
+        conn.send((WORKER_EXCEPTION, traceback.format_exc()))
+    finally:
+        conn.close()
+
+
+def run_isolated(target, args=(), timeout=None, memory_limit=None):
+    """
+    Run target(*args) in a forked worker process with an optional wall-clock timeout (in seconds)
+    and memory limit (in MB). Return (status, value), where status is one of the WORKER_* codes
+    and value is the return value of target (or the traceback for WORKER_EXCEPTION).
+    """
+    context = multiprocessing.get_context('fork')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(
+        target=_run_target, args=(child_conn, target, args, memory_limit), daemon=True
+    )
+    process.start()
+    child_conn.close()
+
+    status, value = WORKER_CRASH, None
+
+    # poll also returns when the worker dies and the pipe is closed
+    if parent_conn.poll(timeout):
+        try:
+            status, value = parent_conn.recv()
+        except EOFError:
+            pass
+    else:
+        status = WORKER_TIMEOUT
+        process.kill()
+
+    process.join()
+    parent_conn.close()
+
+    if status == WORKER_CRASH:
+        logging.error(
+            f'Worker process died with exit code {process.exitcode}'
+        )
+
+    return status, value
@@ -0,0 +1,165 @@
+import logging
+import warnings
+
+import numpy as np
+
+from utils.misc_utils import as_float
+
+# Cells of a timestep scanned by one task of the compiled kernels
+CHUNK_SIZE = 1 << 16
+
+# Compiled kernels by parallel flag, False if numba is not installed (NumPy fallback)
+_kernels = {}
+
+# Multi-threaded kernels, except in forked worker processes (see use_serial_kernels)
+_parallel = True
+
+
+def _compile_kernels(parallel):
+    """
+    Compile the fused kernels with numba (optional dependency)
+    """
+    try:
+        import numba
+    except ImportError:
+        logging.info('numba is not installed: the data checks use NumPy')
+        return False
+
+    @numba.njit(parallel=parallel)
+    def block_stats_kernel(data, mask, chunk_size):
+        # One pass over (time, cell): NaNs outside the mask, min and max of the non-NaN values
+        n_times, n_cells = data.shape
+        n_chunks = (n_cells + chunk_size - 1) // chunk_size
+        nans = np.zeros((n_times, n_chunks), dtype=np.int64)
+        valid = np.zeros((n_times, n_chunks), dtype=np.int64)
+        mins = np.full((n_times, n_chunks), np.inf)
+        maxs = np.full((n_times, n_chunks), -np.inf)
+        for job in numba.prange(n_times * n_chunks):
+            t = job // n_chunks
+            c = job % n_chunks
+            for i in range(c * chunk_size, min(n_cells, (c + 1) * chunk_size)):
+                v = data[t, i]
+                if np.isnan(v):
+                    if not mask[i]:
+                        nans[t, c] += 1
+                else:
+                    valid[t, c] += 1
+                    if v < mins[t, c]:
+                        mins[t, c] = v
+                    if v > maxs[t, c]:
+                        maxs[t, c] = v
+        return nans, valid, mins, maxs
+
+    @numba.njit(parallel=parallel)
+    def max_abs_kernel(a, b, chunk_size):
+        # max(|a - b|) of the non-NaN differences, without temporary arrays
+        n_cells = a.size
+        n_chunks = (n_cells + chunk_size - 1) // chunk_size
+        maxs = np.full(n_chunks, -np.inf)
+        valid = np.zeros(n_chunks, dtype=np.int64)
+        for c in numba.prange(n_chunks):
+            for i in range(c * chunk_size, min(n_cells, (c + 1) * chunk_size)):
+                d = abs(a[i] - b[i])
+                if not np.isnan(d):
+                    valid[c] += 1
+                    if d > maxs[c]:
+                        maxs[c] = d
+        return maxs, valid
+
+    return {'block_stats': block_stats_kernel, 'max_abs': max_abs_kernel}
+
+
+def get_kernels(parallel=None):
+    """
+    Return the compiled kernels (by default those of this process), or False if numba is not available
+    """
+    if parallel is None:
+        parallel = _parallel
+    if parallel not in _kernels:
+        _kernels[parallel] = _compile_kernels(parallel)
+    return _kernels[parallel]
+
+
+def use_serial_kernels():
+    """
+    Use the single-threaded kernels in this process. Called in the forked worker processes:
+    the threads of numba do not survive a fork, and the workers already use the cores
+    """
+    global _parallel
+    _parallel = False
+
+
+def warm_up(parallel=True):
+    """
+    Compile the kernels for float32 and float64 data, e.g. with parallel=False before forking
+    worker processes, which then use them (the kernels of this process stay multi-threaded)
+    """
+    kernels = get_kernels(parallel)
+    if not kernels:
+        return
+
+    import numba
+
+    # The masks of the references are read-only in the workers (shared memory, see ReferenceAssets.share),
+    # another type for numba than the writable masks
+    read_only_mask = np.zeros(1, dtype=bool)
+    read_only_mask.flags.writeable = False
+    masks = [numba.typeof(np.zeros(1, dtype=bool)), numba.typeof(read_only_mask)]
+
+    chunk_size = numba.typeof(CHUNK_SIZE)
+    for dtype in (np.float32, np.float64):
+        data = np.zeros((1, 1), dtype=dtype)
+        for mask in masks:
+            kernels['block_stats'].compile((numba.typeof(data), mask, chunk_size))
+        for other in (np.float32, np.float64):
+            kernels['max_abs'].compile((numba.typeof(data[0]), numba.typeof(np.zeros(1, dtype=other)), chunk_size))
+
+
+def block_stats(block, mask=None):
+    """
+    Statistics of each timestep of a block (time first), in one pass over the data:
+    (number of NaNs outside the mask, nanmin, nanmax), NaN min/max for a timestep without values.
+    mask (shape of a timestep) is True for the cells where NaNs are expected, e.g. the ocean
+    """
+    block = as_float(np.asarray(block))
+    n_times = block.shape[0]
+    data = block.reshape(n_times, -1)
+    if mask is None:
+        mask = np.zeros(data.shape[1], dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool).ravel()
+        if mask.size != data.shape[1]:
+            raise ValueError(f'Mask of {mask.size} cells for data of {data.shape[1]} cells')
+
+    kernels = get_kernels()
+    if not kernels:
+        nan = np.isnan(data)
+        with warnings.catch_warnings():
+            # All-NaN timesteps give NaN, like the compiled kernel
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.count_nonzero(nan & ~mask, axis=1), np.nanmin(data, axis=1), np.nanmax(data, axis=1)
+
+    nans, valid, mins, maxs = kernels['block_stats'](np.ascontiguousarray(data), mask, CHUNK_SIZE)
+    has_values = valid.sum(axis=1) > 0
+    mins = np.where(has_values, mins.min(axis=1), np.nan).astype(block.dtype)
+    maxs = np.where(has_values, maxs.max(axis=1), np.nan).astype(block.dtype)
+    return nans.sum(axis=1), mins, maxs
+
+
+def nan_max_abs(a, b=0.0):
+    """
+    Same as np.nanmax(abs(a - b)), in one pass (NaN if all the differences are NaN)
+    """
+    a, b = np.broadcast_arrays(np.asarray(a), np.asarray(b))
+    if a.size == 0:
+        raise ValueError('nan_max_abs of an empty array')
+
+    kernels = get_kernels()
+    if not kernels or not (np.issubdtype(a.dtype, np.floating) and np.issubdtype(b.dtype, np.floating)):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmax(np.abs(a - b))
+
+    maxs, valid = kernels['max_abs'](np.ascontiguousarray(a).ravel(), np.ascontiguousarray(b).ravel(), CHUNK_SIZE)
+    dtype = np.result_type(a.dtype, b.dtype)
+    return dtype.type(maxs.max()) if valid.sum() else dtype.type(np.nan)
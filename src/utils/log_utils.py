@@ -1,11 +1,33 @@
 import sys
 import logging
+import logging.handlers
 from pathlib import Path
 import datetime
 
-def update_log_paths(root_dir, check_dir: Path):
+ROLLING_LOG_MAX_BYTES = 100 * 1024 * 1024
+ROLLING_LOG_BACKUP_COUNT = 10
+
+
+def get_file_handler(filename, mode, rolling=None):
+    """
+    Return a handler writing to filename, rotated by size if rolling
     """
-    Update the log message paths
+    if rolling:
+        return logging.handlers.RotatingFileHandler(
+            filename=filename, mode=mode,
+            maxBytes=ROLLING_LOG_MAX_BYTES, backupCount=ROLLING_LOG_BACKUP_COUNT
+            )
+    return logging.FileHandler(filename=filename, mode=mode)
+
+
+def update_log_paths(root_dir, check_dir: Path, resume_log_dir=None, rolling=None, run_name=None) -> Path:
+    """
+    Update the log message paths and return the logging directory.
+    If resume_log_dir is given, the logs are appended to the files in this directory.
+    If rolling (a mode name, e.g. "watch"), the logs are appended to size-rotated files
+    in a fixed directory for this mode.
+    If run_name (e.g. "shard-0-of-4"), the logs are written in a fixed directory for this run,
+    so that it can be found by the other runs (e.g. to merge the shards)
     """
     # Remove all old handlers
     log = logging.getLogger()  # root logger
@@ -15,17 +37,37 @@ def update_log_paths(root_dir, check_dir: Path):
     log = logging.getLogger()
     log_format = logging.Formatter('%(levelname)s: %(message)s')
 
-    # Create directory for logs (a new one for each run) 
-    time_now = datetime.datetime.now() 
-    timestamp = f'{time_now.year}-{time_now.month}-{time_now.day}-{time_now.hour}-{time_now.minute}'
-    log_dir_name = f'{root_dir}/{check_dir.name}___{timestamp}'
-    log_dir = Path(log_dir_name)
-    counter = 1
-    while log_dir.exists():
-        log_dir = Path(f'{log_dir_name}___{counter}')
-        counter += 1
-    
-    log_dir.mkdir(parents=True) #, exist_ok=False)
+    if rolling:
+        # One directory for all the checks of a long-lived process
+        log_dir = Path(f'{root_dir}/{check_dir.name}___{rolling}')
+        log_dir.mkdir(parents=True, exist_ok=True)
+        file_mode = 'a'
+
+    elif resume_log_dir is not None:
+        # Continue the logs of an interrupted run
+        log_dir = Path(resume_log_dir)
+        assert log_dir.is_dir(), f"Log directory {log_dir} to resume not found"
+        file_mode = 'a'
+
+    elif run_name:
+        # One directory for each named run (e.g. a shard), replaced by a new run
+        log_dir = Path(f'{root_dir}/{check_dir.name}___{run_name}')
+        log_dir.mkdir(parents=True, exist_ok=True)
+        file_mode = 'w+'
+
+    else:
+        # Create directory for logs (a new one for each run) 
+        time_now = datetime.datetime.now() 
+        timestamp = f'{time_now.year}-{time_now.month}-{time_now.day}-{time_now.hour}-{time_now.minute}'
+        log_dir_name = f'{root_dir}/{check_dir.name}___{timestamp}'
+        log_dir = Path(log_dir_name)
+        counter = 1
+        while log_dir.exists():
+            log_dir = Path(f'{log_dir_name}___{counter}')
+            counter += 1
+        
+        log_dir.mkdir(parents=True) #, exist_ok=False)
+        file_mode = 'w+'
         
     # Set up logging to terminal
     handler_stdout = logging.StreamHandler(stream=sys.stdout)
@@ -34,19 +76,32 @@ def update_log_paths(root_dir, check_dir: Path):
     log.addHandler(handler_stdout)
 
     # Set up logging all info to general log file
-    handler_general = logging.FileHandler(
-        filename=f'{log_dir}/{check_dir.name}_output.log',
-        mode='w+'
+    handler_general = get_file_handler(
+        f'{log_dir}/{check_dir.name}_output.log', file_mode, rolling
         )
     handler_general.setLevel('DEBUG')
     handler_general.setFormatter(log_format)
     log.addHandler(handler_general)
 
     # Set up logging only errors to error file
-    handler_errors = logging.FileHandler(
-        filename=f'{log_dir}/{check_dir.name}_errors.log',
-        mode='w+'
+    handler_errors = get_file_handler(
+        f'{log_dir}/{check_dir.name}_errors.log', file_mode, rolling
         )
     handler_errors.setLevel('ERROR')
     handler_errors.setFormatter(log_format)
     log.addHandler(handler_errors)
+
+    return log_dir
+
+
+class ErrorCountHandler(logging.Handler):
+    """
+    Count the error messages logged so far (used to report errors per checker)
+    """
+
+    def __init__(self):
+        super().__init__(level='ERROR')
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
@@ -0,0 +1,111 @@
+import logging
+
+
+MB = 1024 * 1024
+
+# Timesteps of one variable held in memory at the same time by each checker when streaming
+# (data, mask or accumulators)
+CHECKER_TIMESTEPS = {
+    'spatial_completeness': 2,
+    'valid_ranges': 1,
+    'reference_drift': 2,
+    'states_transitions': 4,
+}
+
+# Strategies: load the selected variables once, or read them in blocks of timesteps
+FULL_LOAD = 'full'
+BLOCKED = 'blocked'
+
+
+class FileFootprint:
+    """
+    Memory needed by the data variables of a file, read from its header (no data is read)
+    """
+
+    def __init__(self, n_bytes, timestep_bytes, n_variables, n_times):
+        self.n_bytes = n_bytes  # All the variables, all the timesteps
+        self.timestep_bytes = timestep_bytes  # Largest variable, one timestep
+        self.n_variables = n_variables
+        self.n_times = n_times
+
+    @classmethod
+    def from_dataset(cls, ds, variables):
+        n_bytes = 0
+        timestep_bytes = 0
+        for var in variables:
+            data_array = ds[var]
+            var_bytes = data_array.size * data_array.dtype.itemsize
+            n_bytes += var_bytes
+            if 'time' in data_array.dims and data_array.sizes['time']:
+                var_bytes //= data_array.sizes['time']
+            timestep_bytes = max(timestep_bytes, var_bytes)
+        n_times = ds.sizes.get('time', 1)
+        return cls(n_bytes, timestep_bytes, len(variables), n_times)
+
+    def working_set(self, strategy, checkers, time_block=1) -> int:
+        """
+        Estimated peak memory (bytes) of the checks of the file
+        """
+        timesteps = max([CHECKER_TIMESTEPS.get(c, 1) for c in checkers] or [1])
+        if strategy == FULL_LOAD:
+            return self.n_bytes + timesteps * self.timestep_bytes
+        return timesteps * time_block * self.timestep_bytes
+
+
+def plan_file(footprint, full_load_limit=None, memory_budget=None, block_size=None):
+    """
+    Choose the strategy of a file: (strategy, number of timesteps read at once).
+    Loading the file once is opt-in: it is loaded if it fits in full_load_limit (None: never loaded)
+    and in the memory budget, otherwise it is read in blocks of timesteps of about block_size bytes per variable
+    """
+    if full_load_limit is not None:
+        limit = full_load_limit if memory_budget is None else min(full_load_limit, memory_budget)
+        if footprint.n_bytes <= limit:
+            return FULL_LOAD, max(footprint.n_times, 1)
+
+    if memory_budget is not None:
+        block_size = memory_budget if block_size is None else min(block_size, memory_budget)
+
+    time_block = 1
+    if block_size is not None and footprint.timestep_bytes:
+        time_block = int(max(1, min(footprint.n_times, block_size // footprint.timestep_bytes)))
+    return BLOCKED, time_block
+
+
+def iter_time_blocks(data_array, time_block):
+    """
+    Yield (index of the first timestep, values of the block) along the time dimension
+    (the time dimension comes first in the values)
+    """
+    data_array = data_array.transpose('time', ...)
+    n_times = data_array.sizes['time']
+    for start in range(0, n_times, time_block):
+        yield start, data_array.isel(time=slice(start, start + time_block)).values
+
+
+class MemoryBudget:
+    """
+    Admission of files (or scenario units) whose estimated memory is known,
+    so that the files running at the same time stay under the budget.
+    A single file larger than the budget is still admitted when nothing else runs
+    """
+
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.in_use = 0
+
+    def can_admit(self, n_bytes) -> bool:
+        return self.budget is None or self.in_use == 0 or self.in_use + n_bytes <= self.budget
+
+    def admit(self, n_bytes):
+        self.in_use += n_bytes
+
+    def release(self, n_bytes):
+        self.in_use -= n_bytes
+
+
+def log_plan(file_name, footprint, strategy, time_block, working_set):
+    logging.info(
+        f'Memory plan for {file_name}: {footprint.n_variables} variable(s), {footprint.n_bytes / MB:.1f} MB, '
+        f'strategy {strategy} ({time_block} timestep(s) at once), estimated peak {working_set / MB:.1f} MB'
+    )
@@ -1,9 +1,11 @@
+import re
 import json
-from typing import Dict
+from typing import Dict, Tuple
 from pathlib import Path
 import logging
 
-import numpy as np
+# The config is checked before logging is set up (see config_utils)
+logger = logging.getLogger(__name__)
 
 
 def read_config_file(config_file_path: str) -> Dict:
@@ -14,28 +16,104 @@ def read_config_file(config_file_path: str) -> Dict:
     return config
 
 
-def check_config_file(config: Dict) -> Dict:
+def check_config_file(config: Dict, known_keys=None) -> Dict:
     """
-    Check that all needed keys are present in the config dictionary
+    Check that all needed keys are present in the config dictionary (without opening any data file).
+    Raise a ValueError listing all the problems found. A missing reference file is only a warning:
+    the runs which do not check its file type do not need it
     """
-    # Check directory exists
-    assert 'check_directory' in config
-    assert Path(config['check_directory']).exists()
+    problems = []
+
+    # Check directory exists (not needed to check single files)
+    if 'directory' in config and not Path(config['directory']).is_dir():
+        problems.append(f"Directory {config['directory']} not found")
 
     # Check flags. If not present, default to true
     flags = ['flag_spatial_completeness', 'flag_spatial_consistency',
-             'flag_temporal_completeness', 'flag_temporal_consistency',
-             'flag_valid_ranges', 'flag_states_transitions'
+             'flag_temporal_consistency', 'flag_valid_ranges', 'flag_states_transitions',
+             'flag_storage_layout', 'flag_reference_drift'
             ]
 
     for flag in flags:
         if flag in config:
-            assert isinstance(config[flag], bool)
+            if not isinstance(config[flag], bool):
+                problems.append(f'{flag} must be true or false')
         else:
             config[flag] = True
 
-    else:
-        assert Path(config['mask_landuse']).exists()
+    file_types = config.get('required_file_types')
+    if not isinstance(file_types, list) or not file_types:
+        problems.append('required_file_types must be a non-empty list')
+        file_types = []
+
+    # One entry per file type
+    for key in ['references', 'required_variables', 'required_coords']:
+        values = config.get(key)
+        if not isinstance(values, dict):
+            problems.append(f'{key} must be a dictionary with the file types as keys')
+            continue
+        for file_type in file_types:
+            if file_type not in values:
+                problems.append(f'{key}: missing file type {file_type}')
+
+    for file_type, paths in (config.get('references') or {}).items():
+        if not isinstance(paths, list) or not paths:
+            problems.append(f'references: {file_type} must be a non-empty list of paths')
+        elif not Path(paths[0]).is_file():
+            logger.warning(
+                f'references: file {paths[0]} not found, the checks of {file_type} files which need it are skipped'
+            )
+
+    for file_type, specs in (config.get('grids') or {}).items():
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) and 'resolution' in spec for spec in specs):
+            problems.append(f'grids: {file_type} must be a list of grids with a "resolution"')
+
+    if config.get('time_schedules') is not None:
+        from utils.path_utils import TIME_CATEGORIES
+        schedules = config['time_schedules']
+        if not isinstance(schedules, dict) or any(category not in TIME_CATEGORIES for category in schedules):
+            problems.append(f'time_schedules must map time categories {list(TIME_CATEGORIES)} to schedules')
+        elif not all(
+            isinstance(schedule, list) and schedule
+            and all(isinstance(step, list) and len(step) == 2 for step in schedule)
+            for schedule in schedules.values()
+        ):
+            problems.append('time_schedules: each schedule must be a list of [step in years, number of steps]')
+
+    # Memory plan, in MB
+    for key in ['full_load_limit', 'memory_budget', 'read_block_size']:
+        value = config.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0):
+            problems.append(f'{key} must be a positive number of MB')
+
+    for key in ['histogram_bins', 'top_k_cells']:
+        value = config.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            problems.append(f'{key} must be a non-negative integer')
+
+    if 'sparse_transitions' in config and not isinstance(config['sparse_transitions'], bool):
+        problems.append('sparse_transitions must be true or false')
+
+    if config.get('shard') is not None:
+        from utils.shard_utils import parse_shard
+        try:
+            parse_shard(config['shard'])
+        except (ValueError, TypeError) as e:
+            problems.append(f'shard: {e}')
+
+    if config.get('select_years') is not None:
+        try:
+            parse_years_range(config['select_years'])
+        except (ValueError, TypeError, AssertionError) as e:
+            problems.append(f'select_years: {e}')
+
+    if known_keys is not None:
+        for key in config:
+            if key not in known_keys:
+                problems.append(f'Unknown key {key}')
+
+    if problems:
+        raise ValueError('\n'.join(problems))
 
     # Check log path. If not present, default to "logs"
     if 'log_path' not in config:
@@ -45,28 +123,63 @@ def check_config_file(config: Dict) -> Dict:
 
 
 
-def get_file_re_pattern(data_source: str) -> str:
-    """
-    Get the regex pattern that should follow every file:
-    variable name + activity_id + dataset_category + target_mip + source_id + grid + YYYYMM/YYYY (start date) + YYYYMM/YYYY (end date)
-    """
-
-    logging.info(
-        f'Found {data_source} variable(s)'
-    )
-    #print(data_source)
-    if data_source == 'landuse':
-        return r'multiple-[a-zA-Z0-9-_]{1,200}_input4MIPs_landState_[a-zA-Z0-9-._]{1,200}_gn_(\d{4})\-(\d{4})\.nc$'
-    else:
-        return r'[a-zA-Z0-9-._]{1,400}_(\d{6})-(\d{6})\.nc$'
-    
-    
-
-def get_valid_data(data: np.ndarray, mask: np.ndarray) -> np.array:
+def get_valid_data(data: 'np.ndarray', mask: 'np.ndarray') -> 'np.array':
     """
     Use the mask file to return the data values that should be valid (with no NaNs)
     """
+    import numpy as np
    
     land_values = np.ma.masked_array(data, mask)
     return land_values
 
+
+
+def as_float(data: 'np.ndarray') -> 'np.ndarray':
+    """
+    Data as floats, keeping its precision (float32 data is not copied to float64)
+    """
+    import numpy as np
+
+    if np.issubdtype(data.dtype, np.floating):
+        return data
+    return data.astype(np.float64)
+
+
+
+def parse_years_range(years) -> Tuple[int, int]:
+    """
+    Parse a time window given as "YYYY-YYYY", "YYYY" or [YYYY, YYYY] into (first year, last year)
+    """
+    if isinstance(years, str):
+        years = years.split('-')
+    years = [int(y) for y in years]
+    assert len(years) in (1, 2), f'Time window should be YYYY or YYYY-YYYY, found {years}'
+    return years[0], years[-1]
+
+
+def get_time_years(time) -> 'np.ndarray':
+    """
+    Return the year of each timestep of a time coordinate, decoded or not 
+    (e.g. "years since 850-01-01 0:0:0" in the landuse files)
+    """
+    import numpy as np
+
+    values = time.values
+
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[Y]').astype(int) + 1970
+
+    if values.dtype == object:
+        # cftime dates
+        return np.array([v.year for v in values])
+
+    units = time.attrs.get('units', '')
+    match = re.match(r'\s*(years|days)\s+since\s+(-?\d+)', units)
+    if match:
+        base_year = int(match.group(2))
+        if match.group(1) == 'years':
+            return (base_year + np.floor(values)).astype(int)
+        return (base_year + np.floor(values / 365)).astype(int)
+
+    # No units: the time values are years
+    return np.floor(values).astype(int)
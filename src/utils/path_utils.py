@@ -1,135 +1,163 @@
-from pathlib import Path
+from typing import Iterable, List
 import logging
-
-
-def get_file_type(file_name) -> str:    
+import os.path
+import re
+
+# <variable>_<activity_id>_<dataset_category>_<target_mip>_<source_id>_<grid_label>_<YYYY>-<YYYY>.nc
+FILE_NAME_PATTERN = re.compile(
+    r'(?P<first_part>[^_]+)_(?P<activity_id>[^_]+)_(?P<dataset_category>[^_]+)_'
+    r'(?P<target_mip>[^_]+)_(?P<source_id>[^_]+)_(?P<grid_type>[^_]+)_'
+    r'(?P<start_date>\d{4})-(?P<end_date>\d{4})\.nc$'
+)
+
+# Naming convention of the landuse files, e.g. multiple-states_input4MIPs_landState_ScenarioMIP_<source_id>_gn_2015-2100.nc
+LANDUSE_PREFIX = 'multiple-'
+LANDUSE_ACTIVITY_ID = 'input4MIPs'
+LANDUSE_DATASET_CATEGORY = 'landState'
+GRID_LABELS = ('gn',)
+
+# Time category of a file from its dates range: the files which start before the first year of the scenarios
+# are histories (e.g. LUH2 850-2015, annual), the others are scenarios (e.g. 2015-2100, 5- and 10-year steps)
+TIME_CATEGORIES = ('history', 'scenario')
+SCENARIO_START_YEAR = 2015
+
+# We suppose that the years of the dates range should be in these ranges
+YEAR_RANGES = {
+    'history': (850, 2500),
+    'scenario': (SCENARIO_START_YEAR, 2500),
+}
+
+
+def get_time_category(start_year) -> str:
     """
-    Return the type of the file extracted from the file name.
+    Time category of a file starting in start_year (see TIME_CATEGORIES)
     """
+    return 'history' if start_year < SCENARIO_START_YEAR else 'scenario'
 
-    filename_firstpart = file_name.split('_')[0]
-    if 'multiple' in filename_firstpart:
-        file_type = filename_firstpart 
-        varname = ''
-    else:
-        s1 = filename_firstpart.split('-')[1:]
-        file_type = '-'.join(s1)
-        varname = filename_firstpart.replace('-','_')
-    logging.info(f'Variable name will be checked for the file type {file_type}')
-    return [varname, file_type, filename_firstpart]
-  
-
-def get_activity_id(file_name) -> str:
+
+def correct_file_name(file_name) -> str:
     """
-    Get the activity id from the file name: 
-    input4MIPs
+    Return the file name with the known deviations from the naming convention corrected
+    ("__" instead of "-", "_off-"/"_on-" instead of "-off-"/"-")
     """
-    activity_id = ""
-    try:
-        activity_id = file_name.split('_')[1] 
-        logging.info(f'Recognized activity id {activity_id}')
-    except:
-        logging.warning(f'Not possible to recognize activity id in the file {file_name}')
+    file_name_corrected = file_name
+    if '__' in file_name_corrected:
+        file_name_corrected = file_name_corrected.replace('__','-')
+    if '_off-' in file_name_corrected:
+        file_name_corrected = file_name_corrected.replace('_off','-off')
+    if '_on-' in file_name_corrected:
+        file_name_corrected = file_name_corrected.replace('_on','-')
+    return file_name_corrected
 
-    return activity_id
 
-def get_dataset_category(file_name) -> str:
+class FileNameInfo:
     """
-    Get the dataset category from the file name:
-    emissions or landState
+    Fields of a file name, parsed once (read only).
+    reason is None if the name follows the naming convention of the landuse files, otherwise the first problem found
     """
-    dataset_category = ""
-    try:
-        dataset_category = file_name.split('_')[2] 
-        logging.info(f'Recognized dataset category {dataset_category}')
-    except:
-        logging.warning(f'Not possible to recognize dataset category in the file {file_name}')
 
-    return dataset_category
+    __slots__ = (
+        'name', 'corrected_name', 'varname', 'file_type', 'first_part',
+        'activity_id', 'dataset_category', 'target_mip', 'source_id', 'grid_type',
+        'dates_range', 'start_year', 'end_year', 'time_category', 'reason'
+    )
 
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            object.__setattr__(self, field, fields.get(field))
 
-def get_target_mip(file_name) -> str:
-    """
-    Get the target mip from the file name:
-    ScenarioMIP
-    """
-    target_mip = ""
-    try:
-        target_mip = file_name.split('_')[3] 
-        logging.info(f'Recognized target mip {target_mip}')
-    except:
-        logging.warning(f'Not possible to recognize target mip in the file {file_name}')
+    def __setattr__(self, field, value):
+        raise AttributeError(f'{type(self).__name__} is read only')
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.name!r}, reason={self.reason!r})'
 
-    return target_mip
+    @property
+    def is_valid(self) -> bool:
+        return self.reason is None
 
 
-def get_source_id(file_name) -> str:
+def parse_file_name(file_name, file_types=None) -> FileNameInfo:
     """
-    Get the source id from the file name:
-    e.g. IAMC-AIM-ssp370-1-1
+    Parse all the fields of a file name in a single pass and validate it against the naming convention
+    of the landuse files (nothing is logged). If file_types is given, a file type which is not in it is also
+    a reason of invalidity
     """
-    source_id = ""
-    try:
-        source_id = file_name.split('_')[4] 
-        logging.info(f'Recognized source id {source_id}')
-    except:
-        logging.warning(f'Not possible to recognize source id in the file {file_name}')
+    corrected_name = correct_file_name(file_name)
 
-    return source_id
+    first_part = corrected_name.split('_', 1)[0]
+    if 'multiple' in first_part:
+        file_type = first_part
+        varname = ''
+    else:
+        file_type = '-'.join(first_part.split('-')[1:])
+        varname = first_part.replace('-', '_')
+
+    fields = dict(
+        name=file_name, corrected_name=corrected_name, varname=varname,
+        file_type=file_type, first_part=first_part, reason=None
+    )
+
+    match = FILE_NAME_PATTERN.match(corrected_name)
+    if match:
+        fields.update(match.groupdict())
+        fields['dates_range'] = f'{match["start_date"]}-{match["end_date"]}'
+        fields['start_year'] = int(match['start_date'][:4])
+        fields['end_year'] = int(match['end_date'][:4])
+        fields['time_category'] = get_time_category(fields['start_year'])
+        del fields['start_date'], fields['end_date']
+    else:
+        # Keep the fields which can be recognized
+        parts = corrected_name.split('_')
+        for i, field in enumerate(['activity_id', 'dataset_category', 'target_mip', 'source_id', 'grid_type'], 1):
+            fields[field] = parts[i] if i < len(parts) else ''
+        fields['dates_range'] = '0000'
+        fields['reason'] = (
+            'does not follow the pattern <variable>_<activity_id>_<dataset_category>_'
+            '<target_mip>_<source_id>_<grid_label>_<YYYY>-<YYYY>.nc'
+        )
+
+    if fields['reason'] is None:
+        if not first_part.startswith(LANDUSE_PREFIX):
+            fields['reason'] = f'not a landuse file (the variable should start with {LANDUSE_PREFIX})'
+        elif file_types is not None and file_type not in file_types:
+            fields['reason'] = f'file type {file_type} is not recognized'
+        elif fields['activity_id'] != LANDUSE_ACTIVITY_ID:
+            fields['reason'] = f"activity id expected: '{LANDUSE_ACTIVITY_ID}', found: {fields['activity_id']}"
+        elif fields['dataset_category'] != LANDUSE_DATASET_CATEGORY:
+            fields['reason'] = (
+                f"dataset category expected: '{LANDUSE_DATASET_CATEGORY}', found: {fields['dataset_category']}"
+            )
+        elif fields['grid_type'] not in GRID_LABELS:
+            fields['reason'] = f"grid label expected: {' or '.join(map(repr, GRID_LABELS))}, found: {fields['grid_type']}"
+        else:
+            min_year, max_year = YEAR_RANGES[fields['time_category']]
+            for year in (fields['start_year'], fields['end_year']):
+                if year < min_year or year > max_year:
+                    fields['reason'] = (
+                        f"incorrect year {year} (should be in the range {min_year}-{max_year} "
+                        f"for a {fields['time_category']})"
+                    )
+                    break
 
+    return FileNameInfo(**fields)
 
-def get_grid_type(file_name) -> str:
+
+def parse_file_names(files: Iterable, file_types=None) -> List[FileNameInfo]:
     """
-    Get the grid type from the file name:
-    gn or gr
+    Parse and validate a whole directory listing (paths or names)
     """
-    grid_type = ""
-    try:
-        grid_type = file_name.split('_')[5] 
-        if (grid_type == 'gn' or grid_type == 'gr'):
-            logging.info(f'Recognized grid label {grid_type}')
-        else:
-            logging.warning(f"Grid label expected: 'gn' or 'gr', found: {grid_type}")
-    except:
-        logging.warning(f'Not possible to recognize grid label in the file {file_name}')
+    return [parse_file_name(os.path.basename(file), file_types) for file in files]
 
-    return grid_type    
 
-
-def get_dates_range(file_name) -> str:
+def log_file_name_info(info: FileNameInfo):
     """
-    Get the year range from the file name and check it. We suppose that the years should be in 1900-2500 range
+    Log the fields recognized in a file name and its problem, if any
     """
-
-    try:
-        dates_range = file_name.split('_')[6].split('.')[0]
-        logging.info(f'Processing dates range {dates_range}')
-        try: 
-            start_date = dates_range.split('-')[0]
-            logging.info(f'Recognized start date {start_date}')
-            if (start_date.isnumeric()):
-                start_year = int(start_date[0:4])
-                if start_year<1900 or start_year>2500:
-                    logging.error(f'Incorrect start year {start_date[0:4]} in the file {file_name} (should be in the range 1900-2500). ')                                
-        except:
-            return '0000'
-        
-        try:
-            end_date = dates_range.split('-')[1]
-            logging.info(f'Recognized end date {end_date}')
-            if (end_date.isnumeric()):
-                end_year = int(end_date[0:4])
-                if end_year<1900 or end_year>2500:
-                    logging.error(f'Incorrect end year {end_date[0:4]} in the file {file_name} (should be in the range 1900-2500). ')
-                                             
-        except:
-            return '0000'
-    except:
-        logging.error(f'Not possible to recognize dates range in the file {file_name}')
-        return '0000'
-
-    return dates_range   
-
-
-
-    
+    logging.info(
+        f'Recognized activity id {info.activity_id}, dataset category {info.dataset_category}, '
+        f'target mip {info.target_mip}, source id {info.source_id}, grid label {info.grid_type}, '
+        f'dates range {info.dates_range} ({info.time_category})'
+    )
+    if info.reason is not None:
+        logging.error(f'File name {info.name}: {info.reason}')
@@ -0,0 +1,90 @@
+import logging
+from pathlib import Path
+from typing import List, Tuple
+
+from utils.path_utils import parse_file_name
+
+# Order of the files of a scenario: the states file is checked first and stays open for the transitions file
+FILE_TYPE_ORDER = ['multiple-states', 'multiple-transitions', 'multiple-management']
+
+
+class ScenarioUnit:
+    """
+    Files of one scenario: the states, transitions and management files with the same
+    source_id, dates range (and other fields of the file name), checked together
+    """
+
+    def __init__(self, key, source_id, dates_range):
+        self.key = key  # File name without the file type
+        self.source_id = source_id
+        self.dates_range = dates_range
+        self.files = {}  # {file type: Path}
+
+    def ordered_files(self) -> List[Path]:
+        return [self.files[t] for t in FILE_TYPE_ORDER if t in self.files] + \
+               [f for t, f in sorted(self.files.items()) if t not in FILE_TYPE_ORDER]
+
+    def size(self) -> int:
+        """
+        Total size of the files in bytes
+        """
+        return sum(f.stat().st_size for f in self.files.values())
+
+
+def get_states_file_name(file_name: str) -> str:
+    """
+    Name of the states file corresponding to a transitions file
+    """
+    return file_name.replace('multiple-transitions', 'multiple-states', 1)
+
+
+def plan_files(files: List[Path], required_file_types: List[str]) -> Tuple[List[ScenarioUnit], List[Path]]:
+    """
+    Parse every file name once and group the files into scenario units.
+    Return the units (sorted by name) and the files which do not belong to a unit
+    (not netCDF, invalid names, duplicates), which are checked on their own.
+    Missing partners are reported before any file is checked
+    """
+    units = {}
+    others = []
+
+    for file in files:
+        if file.suffix != '.nc' or not file.is_file():
+            others.append(file)
+            continue
+
+        info = parse_file_name(file.name, required_file_types)
+        if not info.is_valid:
+            others.append(file)
+            continue
+
+        file_type = info.file_type
+        key = info.corrected_name.split('_', 1)[1]
+        if key not in units:
+            units[key] = ScenarioUnit(key, info.source_id, info.dates_range)
+        unit = units[key]
+
+        if file_type in unit.files:
+            others.append(file)
+            continue
+        unit.files[file_type] = file
+
+    units = [units[key] for key in sorted(units)]
+
+    for unit in units:
+        if 'multiple-transitions' in unit.files and 'multiple-states' not in unit.files:
+            logging.error(
+                f'No states file for {unit.files["multiple-transitions"].name}: '
+                f'the transitions will not be checked against the states'
+            )
+        missing = [t for t in required_file_types if t not in unit.files]
+        if missing:
+            logging.warning(
+                f'Scenario {unit.source_id} ({unit.dates_range}): missing file type(s) {missing}'
+            )
+
+    logging.info(
+        f'Planned {len(units)} scenario(s) and {len(others)} other file(s)'
+    )
+
+    return units, others
@@ -0,0 +1,118 @@
+import hashlib
+import logging
+
+import numpy as np
+
+from utils.config_utils import NON_DATA_VARIABLES
+
+
+
+class ReferenceAssets:
+    """
+    Immutable data taken once from a reference file: the lon/lat grid and the land masks.
+    They are kept in memory (and shared by all checked files of the same type),
+    so the reference file does not have to stay open or be read again.
+    """
+
+    def __init__(self, path, lat, lon, masks, default_var):
+        self.path = path
+        self.lat = lat
+        self.lon = lon
+        self.masks = masks  # {var: boolean mask, True where the reference has NaN}
+        self.default_var = default_var  # var whose mask is used for vars absent from the reference
+        self.shared = None  # SharedArrays holding lat, lon and the masks (see share)
+        self.mask_keys = None  # {var: key of its mask in the shared arrays}
+
+    @classmethod
+    def from_dataset(cls, path, reference):
+        """
+        Read the grid and the masks of all data variables from an opened reference dataset.
+        Identical masks (typically all of them) share the same array
+        """
+        unique_masks = {}
+        masks = {}
+        default_var = None
+
+        data_vars = [v for v in reference.variables.keys() if v not in NON_DATA_VARIABLES]
+        for var in data_vars:
+            if 'time' not in reference[var].dims:
+                continue
+
+            # The mask is taken at the second timestep (the first one if there is a single timestep)
+            n_times = reference.sizes['time']
+            mask = np.isnan(reference[var].isel(time=min(1, n_times - 1)).values)
+
+            key = hashlib.sha1(np.packbits(mask).tobytes()).hexdigest()
+            masks[var] = unique_masks.setdefault(key, mask)
+
+            if default_var is None:
+                default_var = var
+                masks[None] = np.isnan(reference[var].isel(time=0).values)
+
+        logging.info(
+            f'Reference {path}: {len(masks) - 1} variable mask(s), {len(unique_masks)} distinct'
+        )
+
+        return cls(path, reference.lat.values, reference.lon.values, masks, default_var)
+
+    def share(self):
+        """
+        Move the grid and the masks to a shared memory block, which worker processes
+        use without copying them (identical masks stay one array)
+        """
+        if self.shared is not None:
+            return
+
+        from utils.shared_utils import SharedArrays
+
+        keys = {}
+        for mask in self.masks.values():
+            keys.setdefault(id(mask), f'mask_{len(keys)}')
+        self.mask_keys = {var: keys[id(mask)] for var, mask in self.masks.items()}
+        unique_masks = {keys[id(mask)]: mask for mask in self.masks.values()}
+
+        self.shared = SharedArrays({'lat': self.lat, 'lon': self.lon, **unique_masks})
+        self._map_shared()
+
+    def unshare(self):
+        """
+        Free the shared memory block (the arrays stay usable in this process)
+        """
+        if self.shared is not None:
+            self.shared.release()
+            self.shared = None
+
+    def _map_shared(self):
+        self.lat = self.shared['lat']
+        self.lon = self.shared['lon']
+        self.masks = {var: self.shared[key] for var, key in self.mask_keys.items()}
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.shared is not None:
+            # Only the name of the shared block is pickled
+            del state['lat'], state['lon'], state['masks']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.shared is not None:
+            self._map_shared()
+
+    def __contains__(self, var):
+        return var is not None and var in self.masks
+
+    def matches_grid(self, lat, lon, tolerance):
+        """
+        Return True if lat/lon is the grid of the reference: its masks apply only to data on this grid
+        """
+        from utils.grid_utils import GridSpec
+        return GridSpec(self.path, self.lat, self.lon, tolerance).matches(lat, lon)
+
+    def get_mask(self, var):
+        """
+        Return the land mask for var and the reference var it is taken from
+        """
+        if var in self:
+            return self.masks[var], var
+        return self.masks[None], self.default_var
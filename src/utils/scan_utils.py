@@ -0,0 +1,70 @@
+import numpy as np
+
+from utils.memory_utils import iter_time_blocks
+from utils.kernel_utils import block_stats
+from utils.summary_utils import SUMMARY_FIELDS, summarize_block, summarize_sparse
+
+
+class VariableScan:
+    """
+    Statistics of each timestep of a variable, computed in one pass over its data and shared by the checkers:
+    the NaNs outside the mask (SpatialCompletenessChecker), the min and max and the histogram of the values
+    (ValidRangesChecker) and the summaries (ReferenceDriftChecker). The data itself is not kept
+    """
+
+    def __init__(self, histogram=None, summaries=False):
+        self.land_nans = []  # For each timestep: number of NaNs outside the mask
+        self.mins = []  # For each timestep: nanmin (dtype of the data, NaN without values)
+        self.maxs = []
+        self.histogram = histogram  # Histogram of all the values, None if not needed
+        self.summaries = [] if summaries else None  # Array (time, SUMMARY_FIELDS) after the pass, None if not needed
+
+    @classmethod
+    def from_data_array(cls, data_array, time_block=1, mask=None, histogram=None, summaries=False):
+        """
+        Scan a variable with a time dimension, in blocks of timesteps.
+        mask (shape of a timestep) is True for the cells where NaNs are expected
+        """
+        scan = cls(histogram, summaries)
+        for _, block in iter_time_blocks(data_array, time_block):
+            land_nans, mins, maxs = block_stats(block, mask)
+            scan.land_nans.extend(land_nans)
+            scan.mins.extend(mins)
+            scan.maxs.extend(maxs)
+            if scan.histogram is not None:
+                scan.histogram.add(block)
+            if scan.summaries is not None:
+                scan.summaries.append(summarize_block(block))
+        return scan.finish()
+
+    @classmethod
+    def from_sparse_field(cls, field, mask=None, histogram=None, summaries=False):
+        """
+        Scan a variable stored as a sparse field (see SparseField), from its nonzero cells and its NaN masks.
+        The NaNs of the timesteps which have the same NaN cells are counted once
+        """
+        scan = cls(histogram, summaries)
+        mask = np.asarray(mask, dtype=bool).ravel() if mask is not None else None
+        counts = {}
+        for t in range(field.n_times):
+            key = field.nan_masks[t].tobytes() if field.nan_masks[t] is not None else None
+            if key not in counts:
+                counts[key] = field.count_nans(t, mask)
+            scan.land_nans.append(counts[key])
+            scan.mins.append(field.nanmin(t))
+            scan.maxs.append(field.nanmax(t))
+            if scan.histogram is not None:
+                n_zeros = field.n_cells - field.values[t].size - field.n_nans[t]
+                scan.histogram.add(field.values[t], n_zeros, field.n_nans[t])
+            if scan.summaries is not None:
+                scan.summaries.append(summarize_sparse(field, t))
+        return scan.finish()
+
+    def finish(self):
+        if self.summaries is not None:
+            self.summaries = np.concatenate(self.summaries) if self.summaries else np.zeros((0, len(SUMMARY_FIELDS)))
+        return self
+
+    @property
+    def n_times(self) -> int:
+        return len(self.land_nans)
@@ -0,0 +1,68 @@
+import re
+import heapq
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SHARD_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+SHARD_DIR_PATTERN = re.compile(r'___shard-(\d+)-of-(\d+)$')
+
+
+def parse_shard(shard) -> Tuple[int, int]:
+    """
+    Parse a shard given as "i/N" or [i, N] into (index, number of shards), with 0 <= i < N
+    """
+    if isinstance(shard, str):
+        match = SHARD_PATTERN.match(shard)
+        if match is None:
+            raise ValueError(f'Shard should be i/N, found {shard}')
+        index, count = int(match.group(1)), int(match.group(2))
+    else:
+        index, count = [int(v) for v in shard]
+    if not 0 <= index < count:
+        raise ValueError(f'Shard index should be between 0 and {count - 1}, found {index}')
+    return index, count
+
+
+def get_shard_name(index, count) -> str:
+    """
+    Name of the run of a shard (suffix of its logging directory)
+    """
+    return f'shard-{index}-of-{count}'
+
+
+def partition_tasks(sizes: Dict, n_shards: int) -> List[List]:
+    """
+    Split tasks {key: size} into n_shards lists of keys with balanced total sizes
+    (largest task first, to the least loaded shard). The result only depends on the keys and sizes
+    """
+    shards = [[] for _ in range(n_shards)]
+    loads = [(0, index) for index in range(n_shards)]
+    for key in sorted(sizes, key=lambda k: (-sizes[k], str(k))):
+        load, index = heapq.heappop(loads)
+        shards[index].append(key)
+        heapq.heappush(loads, (load + sizes[key], index))
+    return shards
+
+
+def find_shard_dirs(root_dir, check_dir_name, n_shards=None) -> Tuple[int, Dict[int, Path]]:
+    """
+    Find the logging directories of the shards of a directory: (number of shards, {index: directory}).
+    If n_shards is not given, all the shard directories must have the same number of shards
+    """
+    found = {}
+    for path in Path(root_dir).glob(f'{check_dir_name}___shard-*-of-*'):
+        match = SHARD_DIR_PATTERN.search(path.name)
+        if match and path.is_dir():
+            found.setdefault(int(match.group(2)), {})[int(match.group(1))] = path
+
+    if n_shards is None:
+        if len(found) > 1:
+            raise ValueError(f'Shard directories of several runs found (numbers of shards {sorted(found)})')
+        n_shards = next(iter(found), 0)
+
+    shard_dirs = dict(sorted(found.get(n_shards, {}).items()))
+    logging.info(
+        f'Found {len(shard_dirs)} of {n_shards} shard directories in {root_dir}'
+    )
+    return n_shards, shard_dirs
@@ -0,0 +1,81 @@
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Offsets of the arrays in a block are aligned for vectorized reads
+ALIGNMENT = 64
+
+
+def _attach(name):
+    """
+    Attach to an existing block without taking part in its cleanup (the creator unlinks it)
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: the workers share the resource tracker of the creator, where the block
+        # is already registered (it must not be unregistered here)
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedArrays:
+    """
+    Read-only NumPy arrays packed in one multiprocessing.shared_memory block.
+    Forked workers use the arrays of the parent directly; a pickled SharedArrays is
+    only the name and the layout of the block, and is attached zero-copy when unpickled
+    """
+
+    def __init__(self, arrays):
+        self.layout = {}  # {key: (offset, shape, dtype)}
+        size = 0
+        for key, array in arrays.items():
+            array = np.asarray(array)
+            self.layout[key] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        self.block = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.owner = True
+        self.arrays = self._map()
+        for key, array in arrays.items():
+            self.arrays[key].flags.writeable = True
+            self.arrays[key][...] = array
+            self.arrays[key].flags.writeable = False
+
+        logging.info(
+            f'{len(arrays)} array(s) ({size / 1024**2:.1f} MB) in shared memory block {self.block.name}'
+        )
+
+    def _map(self):
+        arrays = {}
+        for key, (offset, shape, dtype) in self.layout.items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self.block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[key] = array
+        return arrays
+
+    def __getstate__(self):
+        return {'name': self.block.name, 'layout': self.layout}
+
+    def __setstate__(self, state):
+        self.layout = state['layout']
+        self.block = _attach(state['name'])
+        self.owner = False
+        self.arrays = self._map()
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+    def release(self):
+        """
+        Free the block (by its creator, when no worker uses it any more)
+        """
+        self.arrays = {}
+        try:
+            self.block.close()
+        except BufferError:
+            # Views of the arrays are still referenced: the memory is freed with the process
+            pass
+        if self.owner:
+            self.block.unlink()
+            self.owner = False
@@ -0,0 +1,131 @@
+import numpy as np
+
+from utils.memory_utils import iter_time_blocks
+
+
+class SparseField:
+    """
+    Values of a variable stored as the nonzero cells of each timestep (COO: flat cell indices and values).
+    The NaN cells (e.g. ocean) are stored as a packed mask, shared between the timesteps and the fields
+    which have the same mask. The other cells are zero
+    """
+
+    def __init__(self, name, shape, dtype):
+        self.name = name
+        self.shape = tuple(shape)  # Shape of one timestep
+        self.n_cells = int(np.prod(self.shape))
+        self.dtype = dtype
+        self.index_dtype = np.int32 if self.n_cells < 2**31 else np.int64
+        self.indices = []  # For each timestep: flat indices of the nonzero cells
+        self.values = []  # For each timestep: values of the nonzero cells
+        self.nan_masks = []  # For each timestep: packed mask of the NaN cells, None if there is none
+        self.n_nans = []
+
+    @classmethod
+    def from_data_array(cls, data_array, time_block=1, masks=None):
+        """
+        Read a variable with a time dimension once, in blocks of timesteps.
+        masks ({bytes: packed mask}) is shared by the fields of a file to store each NaN mask once
+        """
+        data_array = data_array.transpose('time', ...)
+        field = cls(data_array.name, data_array.shape[1:], data_array.dtype)
+        for _, block in iter_time_blocks(data_array, time_block):
+            for data in block:
+                field.append(data, masks)
+        return field
+
+    @property
+    def n_times(self) -> int:
+        return len(self.values)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(i.nbytes + v.nbytes for i, v in zip(self.indices, self.values))
+
+    def density(self) -> float:
+        """
+        Mean fraction of nonzero cells
+        """
+        if not self.n_times:
+            return 0.0
+        return sum(v.size for v in self.values) / (self.n_times * self.n_cells)
+
+    def append(self, data, masks=None):
+        """
+        Add the next timestep
+        """
+        data = np.ravel(data)
+        nan = np.isnan(data)
+        nonzero = np.flatnonzero((data != 0) & ~nan)
+        self.indices.append(nonzero.astype(self.index_dtype))
+        self.values.append(data[nonzero])
+
+        n_nans = int(np.count_nonzero(nan))
+        packed = np.packbits(nan) if n_nans else None
+        if packed is not None and masks is not None:
+            packed = masks.setdefault(packed.tobytes(), packed)
+        self.nan_masks.append(packed)
+        self.n_nans.append(n_nans)
+
+    def nan_mask(self, t):
+        """
+        Boolean mask of the NaN cells at timestep t (flat), None if there is none
+        """
+        if self.nan_masks[t] is None:
+            return None
+        return np.unpackbits(self.nan_masks[t], count=self.n_cells).astype(bool)
+
+    def count_nans(self, t, mask=None) -> int:
+        """
+        Number of NaN cells at timestep t outside mask (flat, True where the NaNs are expected, e.g. the ocean)
+        """
+        if mask is None or self.nan_masks[t] is None:
+            return self.n_nans[t]
+        return int(np.count_nonzero(self.nan_mask(t) & ~mask))
+
+    def has_zeros(self, t) -> bool:
+        return self.values[t].size + self.n_nans[t] < self.n_cells
+
+    def nanmin(self, t):
+        """
+        Same as np.nanmin of the dense timestep t (NaN if all cells are NaN)
+        """
+        candidates = [self.values[t].min()] if self.values[t].size else []
+        if self.has_zeros(t):
+            candidates.append(self.dtype.type(0))
+        return min(candidates) if candidates else np.nan
+
+    def nanmax(self, t):
+        """
+        Same as np.nanmax of the dense timestep t (NaN if all cells are NaN)
+        """
+        candidates = [self.values[t].max()] if self.values[t].size else []
+        if self.has_zeros(t):
+            candidates.append(self.dtype.type(0))
+        return max(candidates) if candidates else np.nan
+
+    def add_to(self, total, t):
+        """
+        Add timestep t to total (flat array of the cells): only the nonzero cells are updated,
+        the NaN cells become NaN
+        """
+        total[self.indices[t]] += self.values[t]
+        mask = self.nan_mask(t)
+        if mask is not None:
+            total[mask] = np.nan
+        return total
+
+
+def sum_sparse_fields(fields, t, dtype=None):
+    """
+    Sum of the fields at timestep t, as a dense array of the shape of a timestep
+    (0 if there is no field, like the sum of no dense array)
+    """
+    if not fields:
+        return 0
+    if dtype is None:
+        dtype = np.result_type(*[field.dtype for field in fields])
+    total = np.zeros(fields[0].n_cells, dtype=dtype)
+    for field in fields:
+        field.add_to(total, t)
+    return total.reshape(fields[0].shape)
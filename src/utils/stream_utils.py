@@ -0,0 +1,54 @@
+import json
+import datetime
+
+
+def to_builtin(value):
+    """
+    Convert numpy scalars/arrays (or anything with tolist) to builtin types for json
+    """
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class ResultsStream:
+    """
+    Write one JSON-lines record per (file, checker) result as soon as it is available.
+    The target can be a regular file or a FIFO; every record is flushed immediately
+    so that a reader on the other side can react to the first error in a file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Opening a FIFO blocks until a reader is attached
+        self.stream = open(path, 'a', buffering=1)
+
+    def write(self, record):
+        record['time'] = datetime.datetime.now().isoformat(timespec='seconds')
+        self.stream.write(json.dumps(record, default=to_builtin) + '\n')
+        self.stream.flush()
+
+    def emit_result(self, file_name, checker, results, n_errors):
+        """
+        Record the results of one checker on one file
+        """
+        self.write({
+            'event': 'result',
+            'file': file_name,
+            'checker': checker,
+            'errors': n_errors,
+            'results': results
+        })
+
+    def emit_file_done(self, file_name, n_errors):
+        """
+        Record that all checkers have finished on one file
+        """
+        self.write({
+            'event': 'file_done',
+            'file': file_name,
+            'errors': n_errors
+        })
+
+    def close(self):
+        self.stream.close()
@@ -0,0 +1,192 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from utils.config_utils import NON_DATA_VARIABLES
+from utils.memory_utils import iter_time_blocks
+from utils.misc_utils import get_time_years
+
+# Statistics of each timestep of a variable, over the land (non-NaN) cells
+SUMMARY_FIELDS = ('count', 'mean', 'q99')
+SUMMARY_QUANTILE = 0.99
+
+# Changed when the summaries change, so that the cached summaries are computed again
+SUMMARY_VERSION = 2
+
+# Land means (and quantiles) smaller than this are not compared (e.g. transitions which are zero everywhere)
+MIN_MEAN = 1.0e-9
+
+
+def order_statistics(values, ranks, n_zeros=0) -> np.ndarray:
+    """
+    Values of the given ranks (0: smallest) among values and n_zeros zeros which are not in values
+    (e.g. the nonzero cells of a sparse field), with np.partition (linear time, no sort)
+    """
+    values = np.asarray(values)
+    n_negative = int(np.count_nonzero(values < 0)) if n_zeros else 0
+
+    # Ranks among values, the ranks of the zeros are not looked up
+    positions = {rank: rank if rank < n_negative else rank - n_zeros for rank in ranks}
+    positions = {rank: i for rank, i in positions.items() if not n_negative <= rank < n_negative + n_zeros}
+    partitioned = np.partition(values, sorted(set(positions.values()))) if positions else values
+
+    return np.array([partitioned[positions[rank]] if rank in positions else 0 for rank in ranks], dtype=np.float64)
+
+
+def summarize_values(values, n_zeros=0) -> np.ndarray:
+    """
+    Summary (SUMMARY_FIELDS) of the non-NaN values of a timestep, with n_zeros zeros which are not in values.
+    The quantile is the same as np.quantile (linear interpolation)
+    """
+    count = values.size + n_zeros
+    if not count:
+        return np.array([0, np.nan, np.nan])
+
+    position = SUMMARY_QUANTILE * (count - 1)
+    low = int(position)
+    low_value, high_value = order_statistics(values, [low, min(low + 1, count - 1)], n_zeros)
+    quantile = low_value + (position - low) * (high_value - low_value)
+
+    return np.array([count, np.sum(values, dtype=np.float64) / count, quantile])
+
+
+def summarize_block(block) -> np.ndarray:
+    """
+    Summary of each timestep of a block (time first): array (time, SUMMARY_FIELDS)
+    """
+    data = np.asarray(block).reshape(block.shape[0], -1)
+    return np.array([summarize_values(row[~np.isnan(row)]) for row in data]).reshape(-1, len(SUMMARY_FIELDS))
+
+
+def summarize_sparse(field, t) -> np.ndarray:
+    """
+    Summary of timestep t of a sparse field, from its nonzero cells (see SparseField): array (1, SUMMARY_FIELDS)
+    """
+    n_zeros = field.n_cells - field.values[t].size - field.n_nans[t]
+    return summarize_values(field.values[t], n_zeros)[np.newaxis]
+
+
+def summarize_variable(data_array, time_block=1) -> np.ndarray:
+    """
+    Summary of each timestep of a variable with a time dimension
+    """
+    return np.concatenate([summarize_block(block) for _, block in iter_time_blocks(data_array, time_block)])
+
+
+class ReferenceSummary:
+    """
+    Summaries of the variables of a reference file for each year, computed once and cached in a file
+    """
+
+    def __init__(self, path, years, summaries):
+        self.path = path
+        self.years = np.asarray(years)
+        self.summaries = summaries  # {var: array (time, SUMMARY_FIELDS)}
+
+    @classmethod
+    def from_dataset(cls, path, reference, time_block=1):
+        summaries = {}
+        for var in reference.variables.keys():
+            if var not in NON_DATA_VARIABLES and 'time' in reference[var].dims:
+                summaries[var] = summarize_variable(reference[var], time_block)
+        logging.info(
+            f'Reference {path}: summaries of {len(summaries)} variable(s) computed'
+        )
+        return cls(path, get_time_years(reference['time']), summaries)
+
+    @classmethod
+    def load(cls, path, cache_path):
+        with np.load(cache_path) as cache:
+            summaries = {key[len('var_'):]: cache[key] for key in cache.files if key.startswith('var_')}
+            return cls(path, cache['years'], summaries)
+
+    def save(self, cache_path):
+        """
+        Write the summaries (through a temporary file: other runs may read the cache at the same time)
+        """
+        cache_path = Path(cache_path)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_name(f'{cache_path.name}.{os.getpid()}.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, years=self.years, **{f'var_{var}': s for var, s in self.summaries.items()})
+        os.replace(tmp_path, cache_path)
+
+    def __contains__(self, var):
+        return var in self.summaries
+
+    def get(self, var, years):
+        """
+        Summary of the reference for the given years (NaN for the years not in the reference)
+        """
+        rows = {year: i for i, year in reversed(list(enumerate(self.years)))}
+        summary = np.full((len(years), len(SUMMARY_FIELDS)), np.nan)
+        for i, year in enumerate(years):
+            if year in rows:
+                summary[i] = self.summaries[var][rows[year]]
+        return summary
+
+
+def get_cache_path(cache_dir, reference_path) -> Path:
+    """
+    Cache file of the summaries of a reference file, named after its path, size and modification time
+    """
+    stat = Path(reference_path).stat()
+    key = f'{Path(reference_path).absolute()}:{stat.st_size}:{stat.st_mtime_ns}:{SUMMARY_VERSION}'
+    return Path(cache_dir) / f'{Path(reference_path).stem}.{hashlib.sha1(key.encode()).hexdigest()[:12]}.npz'
+
+
+def compare_summaries(years, summary, reference, thresholds):
+    """
+    Compare the summary of a variable with the summary of the reference for the same years.
+    Return the problems found
+    """
+    problems = []
+    mean, ref_mean = summary[:, 1], reference[:, 1]
+    count, ref_count = summary[:, 0], reference[:, 0]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        # Scale: e.g. a unit factor, over all the land or in the upper tail of the values
+        max_ratio = thresholds['max_mean_ratio']
+        if max_ratio is not None:
+            for field, label in [(1, 'land mean'), (2, '99% quantile')]:
+                value, ref_value = summary[:, field], reference[:, field]
+                ratio = value / ref_value
+                compared = (np.abs(ref_value) > MIN_MEAN) & (np.abs(value) > MIN_MEAN)
+                wrong = np.flatnonzero(compared & ((ratio > max_ratio) | (ratio < 1 / max_ratio)))
+                if wrong.size:
+                    i = wrong[np.argmax(np.abs(np.log(ratio[wrong])))]
+                    problems.append(
+                        f'{label} {ratio[i]:.3g} times the reference in {wrong.size} timestep(s) '
+                        f'(e.g. {years[i]}: {value[i]:.3g} vs {ref_value[i]:.3g})'
+                    )
+
+        # Jumps between consecutive timesteps which the reference does not have
+        max_change = thresholds['max_step_change']
+        if max_change is not None and len(mean) > 1:
+            change = np.abs(np.diff(mean)) / np.abs(mean[:-1])
+            ref_change = np.abs(np.diff(ref_mean)) / np.abs(ref_mean[:-1])
+            jumps = (np.abs(mean[:-1]) > MIN_MEAN) & (change > max_change) & ~(ref_change > max_change)
+            wrong = np.flatnonzero(jumps)
+            if wrong.size:
+                i = wrong[np.argmax(change[wrong])]
+                problems.append(
+                    f'land mean changes by more than {max_change:.0%} in {wrong.size} step(s) '
+                    f'(e.g. {years[i]}-{years[i + 1]}: {mean[i]:.3g} to {mean[i + 1]:.3g})'
+                )
+
+        # Coverage of the land cells
+        min_ratio = thresholds['min_count_ratio']
+        if min_ratio is not None:
+            wrong = np.flatnonzero((ref_count > 0) & (count / ref_count < min_ratio))
+            if wrong.size:
+                i = wrong[np.argmin(count[wrong] / ref_count[wrong])]
+                problems.append(
+                    f'{count[i]:.0f} land cells vs {ref_count[i]:.0f} in the reference in {years[i]} '
+                    f'({wrong.size} timestep(s) below {min_ratio:.0%})'
+                )
+
+    return problems
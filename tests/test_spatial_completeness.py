@@ -0,0 +1,69 @@
+from pathlib import Path
+
+import numpy as np
+import xarray as xr
+
+from checkers.directory_checker import DirectoryChecker
+
+NAME = 'multiple-states_input4MIPs_landState_ScenarioMIP_IAMC-AIM-ssp370-1-1_gn_2015-2100.nc'
+VARIABLES = ['primf', 'pastr']
+BASE_PATH = str(Path(__file__).resolve().parents[1])
+
+
+def write_states(path, resolution, seed=0):
+    """
+    States file on a regular grid of the resolution, with NaNs on the ocean
+    """
+    lat = np.arange(90 - resolution / 2, -90, -resolution)
+    lon = np.arange(-180 + resolution / 2, 180, resolution)
+    time = np.array([2015, 2020]) - 850
+    land = np.random.default_rng(seed).random((lat.size, lon.size)) < 0.3
+
+    data = np.full((time.size, lat.size, lon.size), 0.5, dtype=np.float32)
+    data[:, ~land] = np.nan
+    ds = xr.Dataset(
+        {var: (('time', 'lat', 'lon'), data, {'units': '1'}) for var in VARIABLES},
+        coords={
+            'time': ('time', time, {'units': 'years since 850-01-01 0:0:0', 'calendar': 'noleap'}),
+            'lat': lat, 'lon': lon,
+        },
+    )
+    ds.to_netcdf(path)
+    return path
+
+
+def check(tmp_path, file, grids=None):
+    checker = DirectoryChecker(
+        log_path=tmp_path / 'logs', base_path=BASE_PATH,
+        references={'multiple-states': [str(tmp_path / 'ref' / NAME)]},
+        flag_temporal_consistency=False, flag_valid_ranges=False, flag_states_transitions=False,
+        flag_storage_layout=False,
+        required_file_types=['multiple-states'], required_variables={'multiple-states': VARIABLES},
+        required_coords={'multiple-states': ['lon', 'lat', 'time']},
+        grids=grids, reference_cache_dir=tmp_path / 'cache',
+    )
+    return checker.check_paths([file])[str(file)]
+
+
+def test_native_grid(tmp_path):
+    (tmp_path / 'ref').mkdir()
+    (tmp_path / 'data').mkdir()
+    write_states(tmp_path / 'ref' / NAME, 4)
+    results = check(tmp_path, write_states(tmp_path / 'data' / NAME, 4))
+
+    assert results['spatial_consistency'] == 0
+    assert results['spatial_completeness'] == [0, 0]
+
+
+def test_other_grid_skips_the_masked_checks(tmp_path):
+    (tmp_path / 'ref').mkdir()
+    (tmp_path / 'data').mkdir()
+    write_states(tmp_path / 'ref' / NAME, 4)
+    results = check(
+        tmp_path, write_states(tmp_path / 'data' / NAME, 10),
+        grids={'multiple-states': [{'name': '10deg', 'resolution': 10}]},
+    )
+
+    assert results['spatial_consistency'] == 0
+    assert results['spatial_completeness'] == -1
+    assert results['reference_drift'] == -1